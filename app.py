@@ -3,41 +3,63 @@ from extensions import db, cache, mail
 import views
 import create_initial_data
 import resources
+import counters
+import schema
+import database
+import question_io
+import principals
+import passwords
+import click
+import os
+import json
 from flask_security import auth_required, Security, login_user
-from flask_security.utils import verify_password
+
+def init_database(user_datastore):
+    schema.upgrade_schema()
+    create_initial_data.create_data(user_datastore)
 
 def create_app():
     app = Flask(__name__)
 
     app.config['DEBUG'] = True
     app.config['SECRET_KEY'] = 'NbrKrOgSTkiVDItpfQzjF6UuX0jNJcuwTKX6MypiCJQ'
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///data.db'
     app.config['SECURITY_PASSWORD_SALT'] = '9RrPTYTgV4c-iFafQeB7RQ'
     app.config['SECURITY_TOKEN_AUTHENTICATION_HEADER'] = 'Authentication-Token'
+    passwords.configure_hashing(app)
     
     app.config['CACHE_TYPE'] = 'redis'
     app.config['CACHE_REDIS_URL'] = 'redis://localhost:6379/0'
-    app.config['CACHE_DEFAULT_TIMEOUT'] = 1
+    app.config['CACHE_DEFAULT_TIMEOUT'] = 6 * 60 * 60
+    app.config['CACHE_L1_MAX_ENTRIES'] = 256
+    app.config['CACHE_L1_PARTITIONS'] = {'principal': int(os.environ.get('CACHE_L1_PRINCIPAL_ENTRIES', 4096))}
     
-    app.config['MAIL_SERVER'] = 'localhost'
-    app.config['MAIL_PORT'] = 1025
+    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'localhost')
+    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 1025))
     app.config['MAIL_USE_TLS'] = False
     app.config['MAIL_USE_SSL'] = False
     app.config['MAIL_DEFAULT_SENDER'] = 'quiz-master@example.com'
     
+    app.config['AUTO_INIT_DB'] = os.environ.get('AUTO_INIT_DB', 'false').lower() == 'true'
+    
+    database.configure_database(app)
     db.init_app(app)
     cache.init_app(app)
     mail.init_app(app)
 
     with app.app_context():
+        database.init_engines(app)
+
         from models import User, Role
         from flask_security import SQLAlchemyUserDatastore
 
         user_datastore = SQLAlchemyUserDatastore(db, User, Role)
         security = Security(app, user_datastore)
+        principals.init_app(app)
         
-        db.create_all()
-        create_initial_data.create_data(user_datastore)
+        # Schema and seed data belong to 'flask init-db'; booting a worker or a
+        # test should not touch the database or hash passwords
+        if app.config['AUTO_INIT_DB']:
+            init_database(user_datastore)
         
     app.config["WTF_CSRF_CHECK_DEFAULT"] = True
     app.config['SECURITY_CSRF_PROTECT_MECHANISMS'] = ['session', 'token']
@@ -47,6 +69,59 @@ def create_app():
 
     views.create_views(app, user_datastore, db)
     
+    @app.cli.command('init-db')
+    def init_db():
+        """Create or upgrade the schema and seed the default roles and users"""
+        init_database(user_datastore)
+        print("Database initialised")
+
+    @app.cli.command('rebuild-counters')
+    def rebuild_counters():
+        """Recompute stored question and attempt counters and the score rollups"""
+        repaired = counters.rebuild_counters() + counters.rebuild_rollups()
+        print(f"Counters rebuilt, {repaired} rows repaired")
+
+    @app.cli.command('import-questions')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(question_io.FORMATS), default=None)
+    @click.option('--chunk-size', type=int, default=question_io.DEFAULT_CHUNK_SIZE)
+    def import_questions(path, fmt, chunk_size):
+        """Bulk load questions from a CSV or JSONL file"""
+        fmt = fmt or question_io.detect_format(path)
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            report = question_io.import_questions(stream, fmt, chunk_size)
+        print(json.dumps(report, indent=2))
+
+    @app.cli.command('export-questions')
+    @click.argument('path', type=click.Path(dir_okay=False, writable=True))
+    @click.option('--format', 'fmt', type=click.Choice(question_io.FORMATS), default=None)
+    @click.option('--quiz-id', type=int, default=None)
+    def export_questions(path, fmt, quiz_id):
+        """Stream the question bank to a CSV or JSONL file"""
+        fmt = fmt or question_io.detect_format(path)
+        with open(path, 'w', encoding='utf-8', newline='') as stream:
+            for chunk in question_io.export_questions(fmt, quiz_id):
+                stream.write(chunk)
+        print(f"Questions exported to {path}")
+
+    @app.cli.command('send-mail')
+    @click.argument('kind', type=click.Choice(['daily_reminders', 'monthly_reports']))
+    @click.option('--batch-size', type=int, default=50)
+    def send_mail(kind, batch_size):
+        """Send a mailing in-process through the batch pipeline, e.g. against MailHog"""
+        import time
+        import workers
+        from mail_delivery import summarize
+        from report_data import iter_user_batches
+
+        started = time.perf_counter()
+        results = []
+        with database.analytics_session() as session:
+            batches = [[user.id for user in batch] for batch in iter_user_batches(session, batch_size)]
+        for user_ids in batches:
+            results.append(workers.deliver_mail(kind, user_ids))
+        print(json.dumps(summarize(kind, results, time.perf_counter() - started), indent=2))
+
     @app.route('/sw.js')
     def service_worker():
         return app.send_static_file('sw.js')
@@ -73,11 +148,22 @@ def create_app():
                     'message': 'Account is not active. Please wait for admin approval.'
                 }), 401
 
-            if not verify_password(data['password'], user.password):
+            try:
+                verified = passwords.check_password(data['password'], user)
+            except passwords.PasswordPoolFull:
+                return jsonify({
+                    'message': 'Too many sign-ins right now. Please try again in a moment.'
+                }), 503, {'Retry-After': '1'}
+
+            if not verified:
                 return jsonify({
                     'message': 'Invalid credentials'
                 }), 401
 
+            # Persist a hash upgraded to the current scheme or cost
+            if db.session.is_modified(user):
+                db.session.commit()
+
             login_user(user)
             auth_token = user.get_auth_token()
             return jsonify({
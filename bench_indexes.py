@@ -0,0 +1,138 @@
+"""Show SQLite query plans and timings for the hot lookups before and after the model indexes.
+
+Usage: python bench_indexes.py [--subjects 20] [--users 2000] [--scores-per-user 25]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import inspect, text
+from extensions import db
+from models import Subject, Chapter, Quiz, Questions, Scores, User, UserRoles
+import schema
+
+HOT_QUERIES = {
+    'questions_by_quiz': (
+        'SELECT id FROM questions WHERE quiz_id = :quiz_id',
+        lambda p: {'quiz_id': random.randint(1, p['quizzes'])}
+    ),
+    'quizzes_by_chapter': (
+        'SELECT id FROM quiz WHERE chapter_id = :chapter_id',
+        lambda p: {'chapter_id': random.randint(1, p['chapters'])}
+    ),
+    'chapters_by_subject': (
+        'SELECT id FROM chapter WHERE subject_id = :subject_id',
+        lambda p: {'subject_id': random.randint(1, p['subjects'])}
+    ),
+    'scores_by_user': (
+        'SELECT quiz_id, total_scored FROM scores WHERE user_id = :user_id',
+        lambda p: {'user_id': random.randint(1, p['users'])}
+    ),
+    'scores_by_user_quiz_recent': (
+        'SELECT time_stamp_of_attempt FROM scores WHERE user_id = :user_id AND quiz_id = :quiz_id '
+        'ORDER BY time_stamp_of_attempt DESC',
+        lambda p: {'user_id': random.randint(1, p['users']), 'quiz_id': random.randint(1, p['quizzes'])}
+    ),
+    'scores_since': (
+        'SELECT COUNT(*) FROM scores WHERE time_stamp_of_attempt >= :since',
+        lambda p: {'since': datetime.now() - timedelta(days=7)}
+    ),
+    'subject_top_scores': (
+        'SELECT subject.name, MAX(scores.total_scored) FROM subject '
+        'JOIN chapter ON subject.id = chapter.subject_id '
+        'JOIN quiz ON chapter.id = quiz.chapter_id '
+        'JOIN scores ON quiz.id = scores.quiz_id GROUP BY subject.name',
+        lambda p: {}
+    ),
+    'roles_by_user': (
+        'SELECT role_id FROM user_roles WHERE user_id = :user_id',
+        lambda p: {'user_id': random.randint(1, p['users'])}
+    ),
+}
+
+def seed(subjects, chapters_per_subject, quizzes_per_chapter, questions_per_quiz, users, scores_per_user):
+    db.session.execute(db.insert(Subject), [{'id': i, 'name': f'Subject {i}'} for i in range(1, subjects + 1)])
+    chapters = subjects * chapters_per_subject
+    db.session.execute(db.insert(Chapter), [
+        {'id': i, 'name': f'Chapter {i}', 'subject_id': (i - 1) // chapters_per_subject + 1}
+        for i in range(1, chapters + 1)
+    ])
+    quizzes = chapters * quizzes_per_chapter
+    db.session.execute(db.insert(Quiz), [
+        {'id': i, 'name': f'Quiz {i}', 'chapter_id': (i - 1) // quizzes_per_chapter + 1}
+        for i in range(1, quizzes + 1)
+    ])
+    db.session.execute(db.insert(Questions), [
+        {'quiz_id': q, 'question_statement': 'q', 'option1': 'a', 'option2': 'b', 'correct_answer': 'a'}
+        for q in range(1, quizzes + 1) for _ in range(questions_per_quiz)
+    ])
+    db.session.execute(db.insert(User), [
+        {'id': i, 'email': f'user{i}@example.com', 'active': True, 'fs_uniquifier': f'u{i}'}
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(db.insert(UserRoles), [{'user_id': i, 'role_id': 2} for i in range(1, users + 1)])
+    now = datetime.now()
+    db.session.execute(db.insert(Scores), [
+        {
+            'user_id': u,
+            'quiz_id': random.randint(1, quizzes),
+            'time_stamp_of_attempt': now - timedelta(days=random.randint(0, 365)),
+            'total_scored': random.randint(0, questions_per_quiz)
+        }
+        for u in range(1, users + 1) for _ in range(scores_per_user)
+    ])
+    db.session.commit()
+    return {'subjects': subjects, 'chapters': chapters, 'quizzes': quizzes, 'users': users}
+
+def drop_declared_indexes():
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        for index in inspector.get_indexes(table.name):
+            db.session.execute(text(f'DROP INDEX IF EXISTS {index["name"]}'))
+    db.session.commit()
+
+def run(label, params, repeat):
+    db.session.execute(text('ANALYZE'))
+    print(f"\n=== {label} ===")
+    for name, (sql, make_args) in HOT_QUERIES.items():
+        plan = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'), make_args(params)).fetchall()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            db.session.execute(text(sql), make_args(params)).fetchall()
+        elapsed_ms = (time.perf_counter() - start) * 1000 / repeat
+        print(f"{name}: {elapsed_ms:.3f} ms/query")
+        for row in plan:
+            print(f"    {row[-1]}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--subjects', type=int, default=20)
+    parser.add_argument('--chapters-per-subject', type=int, default=10)
+    parser.add_argument('--quizzes-per-chapter', type=int, default=10)
+    parser.add_argument('--questions-per-quiz', type=int, default=10)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--scores-per-user', type=int, default=25)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            drop_declared_indexes()
+            params = seed(
+                args.subjects, args.chapters_per_subject, args.quizzes_per_chapter,
+                args.questions_per_quiz, args.users, args.scores_per_user
+            )
+            run('Before (no secondary indexes)', params, args.repeat)
+            schema.ensure_indexes()
+            run('After (model indexes)', params, args.repeat)
+
+if __name__ == '__main__':
+    main()
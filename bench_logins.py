@@ -0,0 +1,62 @@
+"""Measure login throughput under the configured password hashing settings.
+
+Usage: python bench_logins.py [--logins 40] [--threads 1]
+
+Posts to the login endpoint from --threads client threads against a scratch
+SQLite database and reports logins per second, and per core in use. Set
+PASSWORD_HASH, PASSWORD_HASH_ROUNDS and PASSWORD_POOL_WORKERS to compare costs.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+EMAIL = 'admin@iitm.ac.in'
+PASSWORD = 'pass'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'logins.db')
+    os.environ['AUTO_INIT_DB'] = 'true'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import passwords
+    from app import create_app
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    def login(_):
+        response = app.test_client().post('/', json={'email': EMAIL, 'password': PASSWORD})
+        return response.status_code
+
+    # The first login pays for any rehash to the configured cost
+    login(None)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        statuses = list(pool.map(login, range(args.logins)))
+    elapsed = time.perf_counter() - started
+
+    succeeded = sum(1 for status in statuses if status == 200)
+    rate = succeeded / elapsed
+    cores = min(args.threads, os.cpu_count() or 1)
+    if passwords.PASSWORD_POOL_WORKERS:
+        cores = min(cores, passwords.PASSWORD_POOL_WORKERS)
+    rounds = passwords.PASSWORD_HASH_ROUNDS or 'default'
+    print(f"scheme:    {passwords.PASSWORD_HASH} (rounds {rounds}), pool workers {passwords.PASSWORD_POOL_WORKERS}")
+    print(f"logins:    {args.logins} in {elapsed:.2f} s from {args.threads} threads")
+    print(f"rate:      {rate:.1f} logins/s, {rate / cores:.1f} logins/s per core")
+    rejected = statuses.count(503)
+    failed = len(statuses) - succeeded - rejected
+    if rejected or failed:
+        print(f"rejected:  {rejected} busy, {failed} failed")
+
+if __name__ == '__main__':
+    main()
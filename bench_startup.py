@@ -0,0 +1,68 @@
+"""Measure cold start of the Flask app in fresh interpreters and check it against a budget.
+
+Usage: python bench_startup.py [--runs 5] [--budget-ms 1000]
+
+Exits non-zero when the median import + create_app time is over budget or
+when a module that should load lazily is imported at startup.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+LAZY_MODULES = ['matplotlib', 'pandas', 'flask_excel', 'celery']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_ms': (created - imported) * 1000,
+    'loaded': [m for m in %r if m in sys.modules]
+}))
+"""
+
+def probe(env):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE % (LAZY_MODULES,)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tmp, 'startup.db'), AUTO_INIT_DB='false')
+        results = [probe(env) for _ in range(args.runs)]
+
+    totals = [r['import_ms'] + r['create_ms'] for r in results]
+    median = statistics.median(totals)
+    print(f"import:     median {statistics.median(r['import_ms'] for r in results):.1f} ms")
+    print(f"create_app: median {statistics.median(r['create_ms'] for r in results):.1f} ms")
+    print(f"total:      median {median:.1f} ms, max {max(totals):.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    loaded = sorted({m for r in results for m in r['loaded']})
+    if loaded:
+        print(f"Loaded at startup but expected lazily: {', '.join(loaded)}")
+    if median > args.budget_ms or loaded:
+        print("Startup budget exceeded")
+        sys.exit(1)
+    print("Startup within budget")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+from urllib.parse import urlencode
+from flask import request, current_app
+from flask_security import current_user
+from sqlalchemy import event, inspect
+from extensions import db, cache
+from models import Subject, Chapter, Quiz, Questions, Scores, User, Role, UserRoles
+from local_cache import local_cache, publish_invalidation, DEFAULT_PARTITION
+
+# Entries are invalidated by commits, so the TTL only bounds how long an
+# unused entry may sit in Redis
+TAGGED_CACHE_TIMEOUT = 6 * 60 * 60
+
+# A rebuild holding a key's lock longer than this is assumed dead
+RECOMPUTE_LOCK_TIMEOUT = int(os.environ.get('CACHE_RECOMPUTE_LOCK_TIMEOUT', 30))
+# How long a request waits for another worker's rebuild before running its own
+RECOMPUTE_WAIT = float(os.environ.get('CACHE_RECOMPUTE_WAIT', 2))
+RECOMPUTE_POLL_INTERVAL = 0.05
+# Hit/miss counts are kept per process and added to Redis at most this often
+METRICS_FLUSH_INTERVAL = float(os.environ.get('CACHE_METRICS_FLUSH_INTERVAL', 10))
+
+# Key prefixes of every tagged entry, for the hit/miss report
+CACHED_PREFIXES = []
+
+MODEL_TAGS = {
+    Subject: 'subject',
+    Chapter: 'chapter',
+    Quiz: 'quiz',
+    Questions: 'questions',
+    Scores: 'scores'
+}
+
+def _tag_key(tag):
+    return f'tag:{tag}'
+
+def tag_versions(tags):
+    """Fetch the current version of each tag in one round trip"""
+    if not tags:
+        return []
+    versions = cache.get_many(*[_tag_key(tag) for tag in tags])
+    return [int(v) if v is not None else 0 for v in versions]
+
+def _redis_client():
+    return getattr(cache.cache, '_write_client', None)
+
+def invalidate_tags(*tags):
+    """Bump tag versions so every entry built against the old versions is skipped"""
+    redis_client = _redis_client()
+    for tag in tags:
+        version = cache.cache.inc(_tag_key(tag))
+        local_cache.apply_invalidation(tag, version)
+        if redis_client is not None:
+            publish_invalidation(redis_client, tag, version)
+
+def _local_tier():
+    """The in-process tier, when a Redis backend can keep it consistent"""
+    max_entries = current_app.config.get('CACHE_L1_MAX_ENTRIES')
+    partition_limits = current_app.config.get('CACHE_L1_PARTITIONS')
+    if local_cache.start(_redis_client(), max_entries, partition_limits):
+        return local_cache
+    return None
+
+_pending_metrics = Counter()
+_metrics_lock = threading.Lock()
+_metrics_flushed_at = time.monotonic()
+
+def flush_metrics():
+    """Add this process's pending hit/miss counts to the shared Redis counters"""
+    global _metrics_flushed_at
+    with _metrics_lock:
+        pending = dict(_pending_metrics)
+        _pending_metrics.clear()
+        _metrics_flushed_at = time.monotonic()
+    for key, count in pending.items():
+        try:
+            cache.cache.inc(key, count)
+        except Exception:
+            pass
+
+def _record(key_prefix, outcome):
+    # Counted locally so a cached read does not cost an extra Redis write
+    with _metrics_lock:
+        _pending_metrics[f'metrics:{key_prefix}:{outcome}'] += 1
+        due = time.monotonic() - _metrics_flushed_at >= METRICS_FLUSH_INTERVAL
+    if due:
+        flush_metrics()
+
+def cache_stats():
+    """Redis-tier hit, miss and coalesced counts for every tagged entry plus this worker's L1 counters.
+
+    A coalesced miss was answered by another worker's rebuild, or by the
+    stale value while that rebuild ran, instead of building it again.
+    Counts from other processes lag by up to METRICS_FLUSH_INTERVAL.
+    """
+    flush_metrics()
+    keys = []
+    for prefix in CACHED_PREFIXES:
+        keys.extend([f'metrics:{prefix}:hit', f'metrics:{prefix}:miss', f'metrics:{prefix}:coalesced'])
+    values = cache.get_many(*keys) if keys else []
+    stats = {}
+    for i, prefix in enumerate(CACHED_PREFIXES):
+        hits = int(values[3 * i] or 0)
+        misses = int(values[3 * i + 1] or 0)
+        total = hits + misses
+        stats[prefix] = {
+            'hits': hits,
+            'misses': misses,
+            'coalesced': int(values[3 * i + 2] or 0),
+            'hit_ratio': round(hits / total, 4) if total else None
+        }
+    stats['l1'] = local_cache.stats()
+    return stats
+
+def user_scores_tag():
+    return f'scores:user:{current_user.id}'
+
+def request_args_key():
+    return urlencode(sorted(request.args.items(multi=True)))
+
+def register_prefix(key_prefix):
+    if key_prefix not in CACHED_PREFIXES:
+        CACHED_PREFIXES.append(key_prefix)
+
+def _await_rebuild(cache_key, stale_key):
+    """Another worker's result for cache_key, or the stale value at once if allowed"""
+    if stale_key:
+        rv = cache.get(stale_key)
+        if rv is not None:
+            return rv
+    deadline = time.monotonic() + RECOMPUTE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(RECOMPUTE_POLL_INTERVAL)
+        rv = cache.get(cache_key)
+        if rv is not None:
+            return rv
+    return None
+
+def _release_lock(lock_key, token):
+    try:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    except Exception as e:
+        current_app.logger.error(f"Releasing rebuild lock {lock_key} failed: {str(e)}")
+
+def cached_value(key_prefix, tags, build, key_parts=(), timeout=TAGGED_CACHE_TIMEOUT, local=False, stale=False):
+    """Return the entry for key_prefix/key_parts at the current tag versions, building it on a miss.
+
+    ``local`` keeps the entry in the shared L1 partition, or in the named
+    partition when it is a string. Only one worker builds a missing entry at
+    a time; the others wait briefly for its result, or with ``stale`` get the
+    previous value straight away. Tuples returned by ``build`` are treated as
+    errors and never cached.
+    """
+    partition = local if isinstance(local, str) else DEFAULT_PARTITION
+    try:
+        tier = _local_tier() if local else None
+        versions = tier.known_versions(tags) if tier else None
+        if versions is None:
+            versions = tag_versions(tags)
+            if tier:
+                tier.remember_versions(tags, versions)
+        parts = [key_prefix, *key_parts, '.'.join(str(v) for v in versions)]
+        cache_key = ':'.join(parts)
+        if tier:
+            rv = tier.get(cache_key, partition)
+            if rv is not None:
+                return rv
+        rv = cache.get(cache_key)
+    except Exception as e:
+        current_app.logger.error(f"Tagged cache read failed for {key_prefix}: {str(e)}")
+        return build()
+
+    if rv is not None:
+        _record(key_prefix, 'hit')
+        if tier:
+            tier.set(cache_key, rv, tags, partition)
+        return rv
+
+    _record(key_prefix, 'miss')
+    lock_key = f'lock:{cache_key}'
+    # Versions are left out so the previous build stays reachable after a bump
+    stale_key = ':'.join(['stale', key_prefix, *key_parts]) if stale else None
+    token = uuid.uuid4().hex
+    try:
+        leader = cache.add(lock_key, token, timeout=RECOMPUTE_LOCK_TIMEOUT)
+        if not leader:
+            rv = _await_rebuild(cache_key, stale_key)
+            if rv is not None:
+                _record(key_prefix, 'coalesced')
+                return rv
+    except Exception as e:
+        current_app.logger.error(f"Rebuild lock failed for {key_prefix}: {str(e)}")
+        leader = False
+
+    try:
+        rv = build()
+        if not isinstance(rv, tuple):
+            try:
+                cache.set(cache_key, rv, timeout=timeout)
+                if stale_key:
+                    cache.set(stale_key, rv, timeout=timeout * 2)
+                if tier:
+                    tier.set(cache_key, rv, tags, partition)
+            except Exception as e:
+                current_app.logger.error(f"Tagged cache write failed for {key_prefix}: {str(e)}")
+    finally:
+        if leader:
+            _release_lock(lock_key, token)
+    return rv
+
+def cached_by_tags(key_prefix, tags, timeout=TAGGED_CACHE_TIMEOUT, query_string=False, per_user=False, local=False,
+                   stale=False):
+    """Cache a view's result under its key prefix and the versions of the tags it depends on.
+
+    ``tags`` is a list of tag names or a callable returning one, for entries
+    whose dependencies come from the request. ``per_user`` scopes the key to
+    the authenticated user and ``local`` also keeps the entry in the
+    per-process L1 tier. ``stale`` lets requests that arrive during a rebuild
+    get the previous value. Error tuples are never cached.
+    """
+    register_prefix(key_prefix)
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            entry_tags = tags() if callable(tags) else tags
+            key_parts = []
+            if per_user:
+                key_parts.append(f'user:{current_user.id}')
+            if query_string:
+                key_parts.append(request_args_key())
+            return cached_value(
+                key_prefix, entry_tags, lambda: f(*args, **kwargs),
+                key_parts=key_parts, timeout=timeout, local=local, stale=stale
+            )
+        return wrapper
+    return decorator
+
+def quiz_questions_tag(quiz_id):
+    return f'questions:quiz:{quiz_id}'
+
+# Bumped by any change to a role row, since every cached principal embeds role names
+ROLES_TAG = 'roles'
+
+def principal_tag(fs_uniquifier):
+    return f'principal:{fs_uniquifier}'
+
+def _principal_tags(session, obj):
+    """Principal tags for a user whose active flag, roles or uniquifier changed"""
+    if isinstance(obj, Role):
+        return {ROLES_TAG}
+    if isinstance(obj, UserRoles):
+        user_ids = {obj.user_id}
+        user_ids.update(inspect(obj).attrs.user_id.history.deleted)
+        users = [session.get(User, user_id) for user_id in user_ids if user_id is not None]
+    else:
+        users = [obj]
+    tags = set()
+    for user in users:
+        if user is None:
+            continue
+        uniquifiers = {user.fs_uniquifier}
+        uniquifiers.update(inspect(user).attrs.fs_uniquifier.history.deleted)
+        tags.update(principal_tag(u) for u in uniquifiers if u)
+    return tags
+
+def tags_for(obj, session=None):
+    """Tags touched by a change to a model instance"""
+    if isinstance(obj, (User, Role, UserRoles)):
+        return _principal_tags(session, obj)
+    tag = MODEL_TAGS.get(type(obj))
+    if tag is None:
+        return set()
+    tags = {tag}
+    if isinstance(obj, Questions):
+        quiz_ids = {obj.quiz_id}
+        quiz_ids.update(inspect(obj).attrs.quiz_id.history.deleted)
+        tags.update(quiz_questions_tag(quiz_id) for quiz_id in quiz_ids if quiz_id is not None)
+    elif isinstance(obj, Scores) and obj.user_id is not None:
+        tags.add(f'scores:user:{obj.user_id}')
+    return tags
+
+def mark_tags(*tags):
+    """Bump tags when the current transaction commits, for changes made with Core statements"""
+    db.session.info.setdefault('cache_tags', set()).update(tags)
+
+def _collect_tags(session, flush_context):
+    pending = session.info.setdefault('cache_tags', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        pending.update(tags_for(obj, session))
+
+def _invalidate_committed(session):
+    pending = session.info.pop('cache_tags', None)
+    if not pending:
+        return
+    try:
+        invalidate_tags(*sorted(pending))
+    except Exception as e:
+        current_app.logger.error(f"Cache invalidation failed for {sorted(pending)}: {str(e)}")
+
+def _discard_tags(session):
+    session.info.pop('cache_tags', None)
+
+event.listen(db.session, 'after_flush', _collect_tags)
+event.listen(db.session, 'after_commit', _invalidate_committed)
+event.listen(db.session, 'after_soft_rollback', lambda session, previous_transaction: _discard_tags(session))
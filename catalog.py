@@ -0,0 +1,53 @@
+from models import Subject, Chapter, db
+
+def build_subject_catalog(search_query=''):
+    """Build the subject -> chapter -> question_count tree in one query"""
+    rows = db.session.query(
+        Subject.id,
+        Subject.name,
+        Chapter.id,
+        Chapter.name,
+        Chapter.description,
+        Chapter.question_count
+    ).outerjoin(
+        Chapter, Subject.id == Chapter.subject_id
+    ).order_by(
+        Subject.id, Chapter.id
+    ).all()
+
+    search_query = (search_query or '').lower()
+    catalog = []
+    by_subject = {}
+
+    for subject_id, subject_name, chapter_id, chapter_name, chapter_description, question_count in rows:
+        subject_data = by_subject.get(subject_id)
+        if subject_data is None:
+            subject_data = {
+                'id': subject_id,
+                'name': subject_name,
+                'chapters': []
+            }
+            by_subject[subject_id] = subject_data
+            catalog.append(subject_data)
+
+        # Subjects without chapters still come back as one row with a NULL chapter
+        if chapter_id is None:
+            continue
+
+        if not search_query or \
+           search_query in chapter_name.lower() or \
+           (chapter_description and search_query in chapter_description.lower()):
+            subject_data['chapters'].append({
+                'id': chapter_id,
+                'name': chapter_name,
+                'description': chapter_description,
+                'question_count': question_count
+            })
+
+    if search_query:
+        catalog = [
+            s for s in catalog
+            if s['chapters'] or search_query in s['name'].lower()
+        ]
+
+    return catalog
@@ -1,46 +1,167 @@
+import hashlib
+import json
 import os
-import matplotlib
-matplotlib.use('Agg')  # Required for server-side rendering
-import matplotlib.pyplot as plt
-from models import Subject, Chapter, Quiz, Questions, Scores, db
+import tempfile
+import time
+from extensions import cache
+from models import Subject, UserSubjectStats
+from database import analytics_session
 from sqlalchemy import func
-from datetime import datetime
 
 CHARTS_DIR = os.path.join('static', 'charts')
 ADMIN_CHARTS_DIR = os.path.join(CHARTS_DIR, 'admin')
 USER_CHARTS_DIR = os.path.join(CHARTS_DIR, 'user')
 
+# Bump when chart styling changes so files drawn the old way are not reused
+CHART_VERSION = 2
+CHART_MAX_AGE = int(os.environ.get('CHART_MAX_AGE_SECONDS', 7 * 24 * 60 * 60))
+CHART_MAX_FILES = int(os.environ.get('CHART_MAX_FILES', 500))
+# Only chart specs are cached; whether their files still exist is checked per request
+CHART_CACHE_TIMEOUT = 60 * 60
+# How long a queued render blocks identical requests from queueing another
+RENDER_CLAIM_TIMEOUT = 60
+
 # Create directories if they don't exist
 for directory in [CHARTS_DIR, ADMIN_CHARTS_DIR, USER_CHARTS_DIR]:
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def cleanup_charts():
-    """Delete all existing chart files"""
-    for directory in [ADMIN_CHARTS_DIR, USER_CHARTS_DIR]:
-        if os.path.exists(directory):
-            for filename in os.listdir(directory):
-                filepath = os.path.join(directory, filename)
-                try:
-                    os.remove(filepath)
-                except Exception as e:
-                    print(f"Error deleting {filepath}: {str(e)}")
-
-def generate_admin_subject_scores():
-    """Generate bar chart for subject-wise top scores"""
-    # Get subject-wise top scores
-    result = db.session.query(
-        Subject.name,
-        func.max(Scores.total_scored).label('top_score')
-    ).join(
-        Chapter, Subject.id == Chapter.subject_id
-    ).join(
-        Quiz, Chapter.id == Quiz.chapter_id
-    ).join(
-        Scores, Quiz.id == Scores.quiz_id
-    ).group_by(
-        Subject.name
-    ).all()
+def chart_filename(kind, data):
+    """Name a chart after a hash of what it shows, so identical data maps to the same file"""
+    payload = json.dumps([CHART_VERSION, kind, data], default=str)
+    return f"{kind}_{hashlib.sha256(payload.encode()).hexdigest()[:20]}.png"
+
+def gc_charts(directory, max_age=CHART_MAX_AGE, max_files=CHART_MAX_FILES):
+    """Remove charts unused for max_age seconds, then the least recently used beyond max_files"""
+    entries = []
+    for filename in os.listdir(directory):
+        filepath = os.path.join(directory, filename)
+        try:
+            entries.append((os.path.getmtime(filepath), filepath))
+        except OSError:
+            continue
+    entries.sort(reverse=True)
+    cutoff = time.time() - max_age
+    removed = 0
+    for position, (mtime, filepath) in enumerate(entries):
+        if position >= max_files or mtime < cutoff:
+            try:
+                os.remove(filepath)
+                removed += 1
+            except OSError as e:
+                print(f"Error deleting {filepath}: {str(e)}")
+    return removed
+
+def _save_bar_chart(filepath, labels, values, title, xlabel, ylabel):
+    # Imported here so only processes that actually draw pay for matplotlib
+    from matplotlib.figure import Figure
+
+    # A standalone Figure keeps no global pyplot state, so renders can run concurrently
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.bar(range(len(labels)), values)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_xticks(range(len(labels)), labels, rotation=45)
+    fig.tight_layout()
+    fig.savefig(filepath, format='png')
+
+def _save_pie_chart(filepath, labels, values):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 8))
+    ax = fig.subplots()
+    ax.pie(values, labels=labels, autopct='%1.1f%%')
+    ax.axis('equal')
+    fig.tight_layout()
+    fig.savefig(filepath, format='png')
+
+CHART_KINDS = {
+    'subject_scores': (ADMIN_CHARTS_DIR, lambda path, labels, values: _save_bar_chart(
+        path, labels, values, 'Subject-wise Top Scores', 'Subjects', 'Top Score'
+    )),
+    'subject_attempts': (ADMIN_CHARTS_DIR, _save_pie_chart),
+    'subject_questions': (USER_CHARTS_DIR, lambda path, labels, values: _save_bar_chart(
+        path, labels, values, 'Subject-wise Number of Questions', 'Subjects', 'Number of Questions'
+    )),
+    'user_attempts': (USER_CHARTS_DIR, _save_pie_chart)
+}
+
+def _chart_spec(kind, labels, values):
+    """A JSON-serialisable description of one chart, enough to name and draw it"""
+    return {'kind': kind, 'labels': labels, 'values': values}
+
+def chart_path(spec):
+    directory, _ = CHART_KINDS[spec['kind']]
+    return os.path.join(directory, chart_filename(spec['kind'], [spec['labels'], spec['values']]))
+
+def chart_url(spec):
+    return '/' + chart_path(spec).replace(os.sep, '/')
+
+def is_rendered(spec):
+    return os.path.exists(chart_path(spec))
+
+def touch_rendered(spec):
+    """Mark a drawn chart as just used so gc_charts keeps it; False if it is not on disk"""
+    try:
+        os.utime(chart_path(spec))
+        return True
+    except FileNotFoundError:
+        return False
+
+def _render_claim_key(spec):
+    return f'chart_render:{os.path.basename(chart_path(spec))}'
+
+def render_chart(spec):
+    """Draw the chart file for spec unless an identical one exists; returns its path"""
+    filepath = chart_path(spec)
+    if os.path.exists(filepath):
+        # The mtime doubles as the last-used time for gc_charts
+        os.utime(filepath)
+        return filepath
+
+    directory, draw = CHART_KINDS[spec['kind']]
+    # Draw to a private file and rename it into place so readers never see a partial PNG
+    fd, tmp_path = tempfile.mkstemp(prefix='.render_', suffix='.png', dir=directory)
+    os.close(fd)
+    try:
+        draw(tmp_path, spec['labels'], spec['values'])
+        os.replace(tmp_path, filepath)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    finally:
+        # Let a later request queue this chart again if the file is collected
+        cache.delete(_render_claim_key(spec))
+    gc_charts(directory)
+    return filepath
+
+def claim_renders(specs):
+    """Specs not yet drawn and not already queued by another request"""
+    claimed = []
+    for spec in specs:
+        if is_rendered(spec):
+            os.utime(chart_path(spec))
+            continue
+        if cache.add(_render_claim_key(spec), 1, timeout=RENDER_CLAIM_TIMEOUT):
+            claimed.append(spec)
+    return claimed
+
+def admin_subject_scores():
+    """Chart spec for subject-wise top scores"""
+    # Read from the subject rollup instead of scanning every score
+    with analytics_session() as session:
+        result = session.query(
+            Subject.name,
+            func.max(Subject.top_score).label('top_score')
+        ).filter(
+            Subject.attempt_count > 0
+        ).group_by(
+            Subject.name
+        ).order_by(
+            Subject.name
+        ).all()
     
     if not result:
         return None
@@ -51,41 +172,22 @@ def generate_admin_subject_scores():
     if not subjects or not scores or not any(scores):
         return None
     
-    # Clear any existing plots
-    plt.clf()
-    
-    # Create bar chart
-    fig = plt.figure(figsize=(10, 6))
-    plt.bar(range(len(subjects)), scores)
-    plt.title('Subject-wise Top Scores')
-    plt.xlabel('Subjects')
-    plt.ylabel('Top Score')
-    plt.xticks(range(len(subjects)), subjects, rotation=45)
-    plt.tight_layout()
-    
-    # Save chart
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    filepath = os.path.join(ADMIN_CHARTS_DIR, f'subject_scores_{timestamp}.png')
-    plt.savefig(filepath)
-    plt.close(fig)
-    
-    return os.path.basename(filepath)
+    return _chart_spec('subject_scores', subjects, scores)
 
-def generate_admin_subject_attempts():
-    """Generate pie chart for subject-wise user attempts"""
+def admin_subject_attempts():
+    """Chart spec for subject-wise user attempts"""
     # Get subject-wise attempt counts
-    result = db.session.query(
-        Subject.name,
-        func.count(Scores.id).label('attempt_count')
-    ).join(
-        Chapter, Subject.id == Chapter.subject_id
-    ).join(
-        Quiz, Chapter.id == Quiz.chapter_id
-    ).join(
-        Scores, Quiz.id == Scores.quiz_id
-    ).group_by(
-        Subject.name
-    ).all()
+    with analytics_session() as session:
+        result = session.query(
+            Subject.name,
+            func.sum(Subject.attempt_count).label('attempt_count')
+        ).filter(
+            Subject.attempt_count > 0
+        ).group_by(
+            Subject.name
+        ).order_by(
+            Subject.name
+        ).all()
     
     if not result:
         return None
@@ -96,38 +198,22 @@ def generate_admin_subject_attempts():
     if not subjects or not attempts or sum(attempts) == 0:
         return None
     
-    # Clear any existing plots
-    plt.clf()
-    
-    # Create pie chart
-    fig = plt.figure(figsize=(10, 8))
-    plt.pie(attempts, labels=subjects, autopct='%1.1f%%')
-    plt.axis('equal')
-    plt.tight_layout()
-    
-    # Save chart
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    filepath = os.path.join(ADMIN_CHARTS_DIR, f'subject_attempts_{timestamp}.png')
-    plt.savefig(filepath)
-    plt.close(fig)
-    
-    return os.path.basename(filepath)
+    return _chart_spec('subject_attempts', subjects, attempts)
 
-def generate_user_subject_questions():
-    """Generate bar chart for subject-wise number of questions"""
+def user_subject_questions():
+    """Chart spec for subject-wise number of questions"""
     # Get subject-wise question counts
-    result = db.session.query(
-        Subject.name,
-        func.count(Questions.id).label('question_count')
-    ).join(
-        Chapter, Subject.id == Chapter.subject_id
-    ).join(
-        Quiz, Chapter.id == Quiz.chapter_id
-    ).join(
-        Questions, Quiz.id == Questions.quiz_id
-    ).group_by(
-        Subject.name
-    ).all()
+    with analytics_session() as session:
+        result = session.query(
+            Subject.name,
+            func.sum(Subject.question_count).label('question_count')
+        ).filter(
+            Subject.question_count > 0
+        ).group_by(
+            Subject.name
+        ).order_by(
+            Subject.name
+        ).all()
     
     if not result:
         return None
@@ -138,46 +224,25 @@ def generate_user_subject_questions():
     if not subjects or not counts or not any(counts):
         return None
     
-    # Clear any existing plots
-    plt.clf()
-    
-    # Create bar chart
-    fig = plt.figure(figsize=(10, 6))
-    plt.bar(range(len(subjects)), counts)
-    plt.title('Subject-wise Number of Questions')
-    plt.xlabel('Subjects')
-    plt.ylabel('Number of Questions')
-    plt.xticks(range(len(subjects)), subjects, rotation=45)
-    plt.tight_layout()
-    
-    # Save chart
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    filepath = os.path.join(USER_CHARTS_DIR, f'subject_questions_{timestamp}.png')
-    plt.savefig(filepath)
-    plt.close(fig)
-    
-    return os.path.basename(filepath)
-
-def generate_user_subject_attempts(user_id):
-    """Generate pie chart for subject-wise user attempts for current user"""
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    filepath = os.path.join(USER_CHARTS_DIR, f'user_attempts_{timestamp}.png')
-    
-    # Get subject-wise attempt counts for the user
-    result = db.session.query(
-        Subject.name,
-        func.count(Scores.id).label('attempt_count')
-    ).join(
-        Chapter, Subject.id == Chapter.subject_id
-    ).join(
-        Quiz, Chapter.id == Quiz.chapter_id
-    ).join(
-        Scores, Quiz.id == Scores.quiz_id
-    ).filter(
-        Scores.user_id == user_id
-    ).group_by(
-        Subject.name
-    ).all()
+    return _chart_spec('subject_questions', subjects, counts)
+
+def user_subject_attempts(user_id):
+    """Chart spec for subject-wise attempts of one user"""
+    # Read from the per-user rollup instead of joining through every score
+    with analytics_session() as session:
+        result = session.query(
+            Subject.name,
+            func.sum(UserSubjectStats.attempt_count).label('attempt_count')
+        ).join(
+            UserSubjectStats, Subject.id == UserSubjectStats.subject_id
+        ).filter(
+            UserSubjectStats.user_id == user_id,
+            UserSubjectStats.attempt_count > 0
+        ).group_by(
+            Subject.name
+        ).order_by(
+            Subject.name
+        ).all()
     
     if not result:
         return None
@@ -188,15 +253,5 @@ def generate_user_subject_attempts(user_id):
     if not subjects or not attempts or sum(attempts) == 0:
         return None
     
-    # Clear any existing plots
-    plt.clf()
-    
-    # Create pie chart
-    fig = plt.figure(figsize=(10, 8))
-    plt.pie(attempts, labels=subjects, autopct='%1.1f%%')
-    plt.axis('equal')
-    plt.tight_layout()
-    plt.savefig(filepath)
-    plt.close(fig)
-    
-    return os.path.basename(filepath)
\ No newline at end of file
+    # Users with the same breakdown share one file
+    return _chart_spec('user_attempts', subjects, attempts)
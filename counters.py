@@ -0,0 +1,265 @@
+from flask import current_app
+from models import Subject, Chapter, Quiz, Questions, Scores, UserSubjectStats, db
+from sqlalchemy import bindparam, case, delete, func, insert, inspect, select, text, update
+from cache_tags import invalidate_tags, mark_tags
+
+# Core UPDATEs bypass the ORM flush listener, so repairs bump these by hand
+COUNTER_TAGS = ('subject', 'chapter', 'quiz', 'questions', 'scores')
+
+COUNTER_COLUMNS = {
+    Quiz: ['question_count', 'attempt_count'],
+    Chapter: ['question_count', 'attempt_count'],
+    Subject: ['question_count', 'attempt_count', 'top_score']
+}
+
+def _quiz_chapter_id(quiz_id):
+    return select(Quiz.chapter_id).where(Quiz.id == quiz_id).scalar_subquery()
+
+def _quiz_subject_id(quiz_id):
+    return select(Chapter.subject_id).join(
+        Quiz, Chapter.id == Quiz.chapter_id
+    ).where(Quiz.id == quiz_id).scalar_subquery()
+
+def _adjust(column, quiz_id, delta):
+    """Shift a counter on a quiz and its chapter and subject in the current transaction"""
+    if not delta:
+        return
+    db.session.execute(
+        update(Subject)
+        .where(Subject.id == _quiz_subject_id(quiz_id))
+        .values({column: getattr(Subject, column) + delta})
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(Chapter)
+        .where(Chapter.id == _quiz_chapter_id(quiz_id))
+        .values({column: getattr(Chapter, column) + delta})
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(Quiz)
+        .where(Quiz.id == quiz_id)
+        .values({column: getattr(Quiz, column) + delta})
+        .execution_options(synchronize_session=False)
+    )
+
+def adjust_question_count(quiz_id, delta):
+    _adjust('question_count', quiz_id, delta)
+
+def adjust_attempt_count(quiz_id, delta):
+    _adjust('attempt_count', quiz_id, delta)
+
+def _bump_user_subject_attempts(user_id, subject_id):
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        db.session.execute(
+            dialect_insert(UserSubjectStats)
+            .values(user_id=user_id, subject_id=subject_id, attempt_count=1)
+            .on_conflict_do_update(
+                index_elements=['user_id', 'subject_id'],
+                set_={'attempt_count': UserSubjectStats.attempt_count + 1}
+            )
+        )
+        return
+    updated = db.session.execute(
+        update(UserSubjectStats)
+        .where(UserSubjectStats.user_id == user_id, UserSubjectStats.subject_id == subject_id)
+        .values(attempt_count=UserSubjectStats.attempt_count + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
+        db.session.execute(insert(UserSubjectStats).values(user_id=user_id, subject_id=subject_id, attempt_count=1))
+
+def add_attempt(quiz_id, user_id, total_scored):
+    """Fold a new score into the attempt counters and subject rollups in the current transaction"""
+    adjust_attempt_count(quiz_id, 1)
+    subject_id = db.session.execute(
+        select(Chapter.subject_id).join(Quiz, Chapter.id == Quiz.chapter_id).where(Quiz.id == quiz_id)
+    ).scalar()
+    if subject_id is None:
+        return
+    score = total_scored or 0
+    db.session.execute(
+        update(Subject)
+        .where(Subject.id == subject_id)
+        .values(top_score=case((Subject.top_score < score, score), else_=Subject.top_score))
+        .execution_options(synchronize_session=False)
+    )
+    _bump_user_subject_attempts(user_id, subject_id)
+
+def remove_subject_rollups(subject_id):
+    db.session.execute(
+        delete(UserSubjectStats)
+        .where(UserSubjectStats.subject_id == subject_id)
+        .execution_options(synchronize_session=False)
+    )
+
+def _rebuild_subject_rollups(subject_id, exclude_chapter_id):
+    """Recompute one subject's top score and per-user attempts without one chapter's scores"""
+    subject_scores = select(Scores.user_id, Scores.total_scored).join(
+        Quiz, Scores.quiz_id == Quiz.id
+    ).join(
+        Chapter, Quiz.chapter_id == Chapter.id
+    ).where(Chapter.subject_id == subject_id, Chapter.id != exclude_chapter_id).subquery()
+    db.session.execute(
+        update(Subject)
+        .where(Subject.id == subject_id)
+        .values(top_score=select(func.coalesce(func.max(subject_scores.c.total_scored), 0)).scalar_subquery())
+        .execution_options(synchronize_session=False)
+    )
+    remove_subject_rollups(subject_id)
+    db.session.execute(
+        insert(UserSubjectStats).from_select(
+            ['user_id', 'subject_id', 'attempt_count'],
+            select(
+                subject_scores.c.user_id, bindparam('subject_id', subject_id), func.count()
+            ).group_by(subject_scores.c.user_id)
+        )
+    )
+
+def remove_chapter_counts(chapter):
+    """Take a deleted chapter's totals and scores off its subject"""
+    db.session.execute(
+        update(Subject)
+        .where(Subject.id == chapter.subject_id)
+        .values(
+            question_count=Subject.question_count - (chapter.question_count or 0),
+            attempt_count=Subject.attempt_count - (chapter.attempt_count or 0)
+        )
+        .execution_options(synchronize_session=False)
+    )
+    _rebuild_subject_rollups(chapter.subject_id, chapter.id)
+    mark_tags('subject')
+
+def _invalidate_repaired(repaired):
+    if not repaired:
+        return
+    try:
+        invalidate_tags(*COUNTER_TAGS)
+    except Exception as e:
+        current_app.logger.error(f"Cache invalidation after counter repair failed: {str(e)}")
+
+def rebuild_counters():
+    """Recompute every stored counter from the source rows and return how many rows drifted"""
+    repaired = 0
+
+    quiz_questions = select(func.count(Questions.id)).where(
+        Questions.quiz_id == Quiz.id
+    ).scalar_subquery()
+    quiz_attempts = select(func.count(Scores.id)).where(
+        Scores.quiz_id == Quiz.id
+    ).scalar_subquery()
+    repaired += db.session.execute(
+        update(Quiz)
+        .where((Quiz.question_count != quiz_questions) | (Quiz.attempt_count != quiz_attempts) |
+               Quiz.question_count.is_(None) | Quiz.attempt_count.is_(None))
+        .values(question_count=quiz_questions, attempt_count=quiz_attempts)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    chapter_questions = select(func.coalesce(func.sum(Quiz.question_count), 0)).where(
+        Quiz.chapter_id == Chapter.id
+    ).scalar_subquery()
+    chapter_attempts = select(func.coalesce(func.sum(Quiz.attempt_count), 0)).where(
+        Quiz.chapter_id == Chapter.id
+    ).scalar_subquery()
+    repaired += db.session.execute(
+        update(Chapter)
+        .where((Chapter.question_count != chapter_questions) | (Chapter.attempt_count != chapter_attempts) |
+               Chapter.question_count.is_(None) | Chapter.attempt_count.is_(None))
+        .values(question_count=chapter_questions, attempt_count=chapter_attempts)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    subject_questions = select(func.coalesce(func.sum(Chapter.question_count), 0)).where(
+        Chapter.subject_id == Subject.id
+    ).scalar_subquery()
+    subject_attempts = select(func.coalesce(func.sum(Chapter.attempt_count), 0)).where(
+        Chapter.subject_id == Subject.id
+    ).scalar_subquery()
+    repaired += db.session.execute(
+        update(Subject)
+        .where((Subject.question_count != subject_questions) | (Subject.attempt_count != subject_attempts) |
+               Subject.question_count.is_(None) | Subject.attempt_count.is_(None))
+        .values(question_count=subject_questions, attempt_count=subject_attempts)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    db.session.commit()
+    _invalidate_repaired(repaired)
+    return repaired
+
+def rebuild_rollups():
+    """Recompute subject top scores and per-user subject attempts; returns how many rows drifted"""
+    subject_top = select(func.coalesce(func.max(Scores.total_scored), 0)).join(
+        Quiz, Scores.quiz_id == Quiz.id
+    ).join(
+        Chapter, Quiz.chapter_id == Chapter.id
+    ).where(Chapter.subject_id == Subject.id).scalar_subquery()
+    repaired = db.session.execute(
+        update(Subject)
+        .where((Subject.top_score != subject_top) | Subject.top_score.is_(None))
+        .values(top_score=subject_top)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    fresh = {
+        (user_id, subject_id): attempts
+        for user_id, subject_id, attempts in db.session.query(
+            Scores.user_id, Chapter.subject_id, func.count(Scores.id)
+        ).join(
+            Quiz, Scores.quiz_id == Quiz.id
+        ).join(
+            Chapter, Quiz.chapter_id == Chapter.id
+        ).group_by(Scores.user_id, Chapter.subject_id)
+    }
+    stored = {
+        (row.user_id, row.subject_id): row.attempt_count
+        for row in db.session.query(
+            UserSubjectStats.user_id, UserSubjectStats.subject_id, UserSubjectStats.attempt_count
+        )
+    }
+    drifted = [key for key in stored.keys() | fresh.keys() if stored.get(key) != fresh.get(key)]
+    if drifted:
+        connection = db.session.connection()
+        connection.execute(
+            delete(UserSubjectStats).where(
+                UserSubjectStats.user_id == bindparam('u'),
+                UserSubjectStats.subject_id == bindparam('s')
+            ),
+            [{'u': user_id, 's': subject_id} for user_id, subject_id in drifted]
+        )
+        rows = [
+            {'user_id': user_id, 'subject_id': subject_id, 'attempt_count': fresh[(user_id, subject_id)]}
+            for user_id, subject_id in drifted if (user_id, subject_id) in fresh
+        ]
+        if rows:
+            connection.execute(insert(UserSubjectStats), rows)
+    repaired += len(drifted)
+
+    db.session.commit()
+    _invalidate_repaired(repaired)
+    return repaired
+
+def ensure_counter_columns():
+    """Add the counter columns to databases created before they existed"""
+    inspector = inspect(db.engine)
+    added = False
+    for model, columns in COUNTER_COLUMNS.items():
+        table = model.__tablename__
+        existing = {c['name'] for c in inspector.get_columns(table)}
+        for column in columns:
+            if column not in existing:
+                db.session.execute(text(
+                    f'ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0'
+                ))
+                added = True
+    db.session.commit()
+    if added:
+        rebuild_counters()
+        rebuild_rollups()
+    return added
@@ -0,0 +1,72 @@
+import os
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from extensions import db
+
+ANALYTICS_BIND = 'analytics'
+
+def _is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+def configure_database(app):
+    """Load database settings from the environment into app.config"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///data.db')
+    analytics_url = os.environ.get('ANALYTICS_DATABASE_URL', app.config['SQLALCHEMY_DATABASE_URI'])
+
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 10))
+    app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app, app.config['SQLALCHEMY_DATABASE_URI'])
+    analytics_options = engine_options(app, analytics_url)
+    if make_url(analytics_url).get_backend_name() == 'postgresql':
+        analytics_options['connect_args'] = {'options': '-c default_transaction_read_only=on'}
+    app.config['SQLALCHEMY_BINDS'] = {ANALYTICS_BIND: dict(analytics_options, url=analytics_url)}
+
+def engine_options(app, url):
+    if _is_sqlite(url):
+        # Pragmas are set per connection in init_engines; the default pool is fine
+        return {}
+    return {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_recycle': app.config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': app.config['DB_POOL_PRE_PING']
+    }
+
+def _sqlite_pragmas(app, read_only):
+    pragmas = [
+        f"PRAGMA journal_mode={app.config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={app.config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT_MS']}"
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+    return on_connect
+
+def init_engines(app):
+    """Attach connection pragmas to SQLite engines; call inside an app context after db.init_app"""
+    for bind_key, engine in db.engines.items():
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', _sqlite_pragmas(app, read_only=bind_key == ANALYTICS_BIND))
+
+@contextmanager
+def analytics_session():
+    """Read-only session for reporting queries so they never hold write locks"""
+    session = Session(bind=db.engines[ANALYTICS_BIND])
+    try:
+        yield session
+    finally:
+        session.close()
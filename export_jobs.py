@@ -0,0 +1,123 @@
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from extensions import cache
+from user_export import EXPORT_DIR
+
+# Finished exports stay downloadable for this long
+EXPORT_TTL = int(os.environ.get('EXPORT_TTL_SECONDS', 24 * 60 * 60))
+# A job that has not finished by then is assumed lost and no longer blocks new ones
+EXPORT_JOB_TIMEOUT = int(os.environ.get('EXPORT_JOB_TIMEOUT_SECONDS', 60 * 60))
+PROGRESS_EVERY = 500
+ACTIVE_KEY = 'export_job:active'
+ACTIVE_STATUSES = ('queued', 'running')
+
+def _job_key(job_id):
+    return f'export_job:{job_id}'
+
+def get_job(job_id):
+    return cache.get(_job_key(job_id))
+
+def save_job(job):
+    cache.set(_job_key(job['id']), job, timeout=EXPORT_TTL + EXPORT_JOB_TIMEOUT)
+    return job
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+def claim_export(requested_by):
+    """Create a queued job, or return the export already in flight.
+
+    Returns (job, created). Only one export runs at a time, so repeated
+    clicks share the first job instead of each scanning every table.
+    """
+    job = {
+        'id': uuid.uuid4().hex,
+        'status': 'queued',
+        'requested_by': requested_by,
+        'task_id': None,
+        'processed': 0,
+        'total': None,
+        'progress': 0,
+        'created_at': _now(),
+        'finished_at': None,
+        'expires_at': None,
+        'file': None,
+        'size': None,
+        'error': None
+    }
+    for _ in range(2):
+        if cache.add(ACTIVE_KEY, job['id'], timeout=EXPORT_JOB_TIMEOUT):
+            return save_job(job), True
+        active = get_job(cache.get(ACTIVE_KEY) or '')
+        if active and active['status'] in ACTIVE_STATUSES:
+            return active, False
+        # The pointer outlived its job; clear it and claim again
+        cache.delete(ACTIVE_KEY)
+    return save_job(job), True
+
+def release_export(job_id):
+    if cache.get(ACTIVE_KEY) == job_id:
+        cache.delete(ACTIVE_KEY)
+
+def update_job(job_id, **changes):
+    job = get_job(job_id)
+    if job is None:
+        return None
+    job.update(changes)
+    if job['total']:
+        job['progress'] = round(min(job['processed'], job['total']) * 100 / job['total'], 1)
+    return save_job(job)
+
+def track_progress(job_id, rows, total):
+    """Pass rows through, recording how many data rows have been written"""
+    update_job(job_id, status='running', total=total)
+    processed = -1
+    for row in rows:
+        yield row
+        processed += 1
+        if processed and processed % PROGRESS_EVERY == 0:
+            update_job(job_id, processed=processed)
+
+def finish_job(job_id, path, processed):
+    expires_at = datetime.now() + timedelta(seconds=EXPORT_TTL)
+    job = update_job(
+        job_id,
+        status='done',
+        processed=processed,
+        progress=100,
+        finished_at=_now(),
+        expires_at=expires_at.isoformat(timespec='seconds'),
+        file=os.path.basename(path),
+        size=os.path.getsize(path)
+    )
+    release_export(job_id)
+    return job
+
+def fail_job(job_id, error):
+    job = update_job(job_id, status='failed', finished_at=_now(), error=error)
+    release_export(job_id)
+    return job
+
+def artifact_path(job):
+    """Path of a finished job's file, or None once it has expired or been removed"""
+    if not job or job['status'] != 'done' or not job['file']:
+        return None
+    if datetime.fromisoformat(job['expires_at']) < datetime.now():
+        return None
+    path = os.path.join(EXPORT_DIR, job['file'])
+    return path if os.path.isfile(path) else None
+
+def purge_expired_exports():
+    """Delete export files older than the TTL; returns how many were removed"""
+    if not os.path.isdir(EXPORT_DIR):
+        return 0
+    cutoff = time.time() - EXPORT_TTL
+    removed = 0
+    for name in os.listdir(EXPORT_DIR):
+        path = os.path.join(EXPORT_DIR, name)
+        if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    return removed
@@ -10,5 +10,5 @@ mail = Mail()
 cache = Cache(config={
     'CACHE_TYPE': 'redis',
     'CACHE_REDIS_URL': 'redis://localhost:6379/0',
-    'CACHE_DEFAULT_TIMEOUT': 1
+    'CACHE_DEFAULT_TIMEOUT': 6 * 60 * 60
 })
\ No newline at end of file
@@ -0,0 +1,37 @@
+from models import Questions, db
+from cache_tags import cached_value, quiz_questions_tag, register_prefix
+
+register_prefix('answer_key')
+
+def build_answer_key(quiz_id):
+    """Map question id -> correct answer for one quiz"""
+    rows = db.session.query(
+        Questions.id,
+        Questions.correct_answer
+    ).filter(
+        Questions.quiz_id == quiz_id
+    ).all()
+    return {question_id: correct_answer for question_id, correct_answer in rows}
+
+def get_answer_key(quiz_id):
+    """Answer key for a quiz, cached against the version of the quiz's questions"""
+    return cached_value(
+        'answer_key',
+        [quiz_questions_tag(quiz_id)],
+        lambda: build_answer_key(quiz_id),
+        key_parts=[str(quiz_id)],
+        local=True
+    )
+
+def grade_answers(quiz_id, answers):
+    """Count correct answers; answers maps question id -> chosen option"""
+    answer_key = get_answer_key(quiz_id)
+    total_scored = 0
+    for question_id, answer in answers.items():
+        try:
+            question_id = int(question_id)
+        except (TypeError, ValueError):
+            continue
+        if question_id in answer_key and answer_key[question_id] == answer:
+            total_scored += 1
+    return total_scored, len(answer_key)
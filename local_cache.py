@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+INVALIDATION_CHANNEL = 'quiz-master:cache-invalidation'
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_PARTITION = 'default'
+# Reconnect delay after a listener failure, doubling up to the maximum while Redis stays down
+LISTENER_RETRY_MIN = 1
+LISTENER_RETRY_MAX = 60
+
+logger = logging.getLogger(__name__)
+
+class LocalCache:
+    """Per-process LRU kept in front of Redis for hot, rarely changing entries.
+
+    Tag versions are mirrored locally and kept current by a pub/sub listener,
+    so a warm entry is served without touching the network. Whenever the
+    listener is not subscribed the mirror is not trusted and callers fall back
+    to reading versions from Redis.
+
+    Entries live in named partitions, each with its own LRU and size, so a
+    large working set such as per-user principals cannot evict shared ones.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.limits = {DEFAULT_PARTITION: max_entries}
+        self._partitions = {}
+        self._tag_versions = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self.live = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def start(self, redis_client, max_entries=None, partition_limits=None):
+        """Start the invalidation listener once per process; returns whether the mirror is usable"""
+        if redis_client is None:
+            return False
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # A forked worker inherits the parent's entries but not its thread
+                    self._pid = os.getpid()
+                    self.live = False
+                    self._partitions.clear()
+                    self._tag_versions.clear()
+                    if max_entries:
+                        self.limits[DEFAULT_PARTITION] = max_entries
+                    self.limits.update(partition_limits or {})
+                    listener = threading.Thread(
+                        target=self._listen, args=(redis_client,), name='l1-cache-invalidation', daemon=True
+                    )
+                    listener.start()
+        return self.live
+
+    def _listen(self, redis_client):
+        delay = LISTENER_RETRY_MIN
+        while True:
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                with self._lock:
+                    # Anything seen before subscribing may have missed a broadcast
+                    self._partitions.clear()
+                    self._tag_versions.clear()
+                    self.live = True
+                delay = LISTENER_RETRY_MIN
+                for message in pubsub.listen():
+                    data = json.loads(message['data'])
+                    self.apply_invalidation(data['tag'], data['version'])
+            except Exception as e:
+                logger.warning("L1 cache listener error, retrying in %ss: %s", delay, e)
+            self.live = False
+            time.sleep(delay)
+            delay = min(delay * 2, LISTENER_RETRY_MAX)
+
+    def known_versions(self, tags):
+        """Locally mirrored versions for tags, or None if any is unknown"""
+        if not self.live:
+            return None
+        with self._lock:
+            try:
+                return [self._tag_versions[tag] for tag in tags]
+            except KeyError:
+                return None
+
+    def remember_versions(self, tags, versions):
+        with self._lock:
+            for tag, version in zip(tags, versions):
+                # Versions only grow, so a late read can never roll back a broadcast
+                self._tag_versions[tag] = max(version, self._tag_versions.get(tag, 0))
+
+    def apply_invalidation(self, tag, version):
+        with self._lock:
+            self._tag_versions[tag] = max(version, self._tag_versions.get(tag, 0))
+            for entries in self._partitions.values():
+                stale = [key for key, (_, tags) in entries.items() if tag in tags]
+                for key in stale:
+                    del entries[key]
+                self.invalidations += len(stale)
+
+    def get(self, key, partition=DEFAULT_PARTITION):
+        with self._lock:
+            entries = self._partitions.get(partition)
+            entry = entries.get(key) if entries else None
+            if entry is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, tags, partition=DEFAULT_PARTITION):
+        with self._lock:
+            entries = self._partitions.setdefault(partition, OrderedDict())
+            entries[key] = (value, frozenset(tags))
+            entries.move_to_end(key)
+            max_entries = self.limits.get(partition, self.limits[DEFAULT_PARTITION])
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'pid': os.getpid(),
+            'live': self.live,
+            'entries': {name: len(entries) for name, entries in self._partitions.items()},
+            'max_entries': dict(self.limits),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+local_cache = LocalCache()
+
+def publish_invalidation(redis_client, tag, version):
+    redis_client.publish(INVALIDATION_CHANNEL, json.dumps({'tag': tag, 'version': version}))
@@ -0,0 +1,42 @@
+from extensions import mail
+
+def send_batch(messages):
+    """Send (user id, email, Message) tuples over one SMTP connection.
+
+    A message that is None (it failed to render) or that the server rejects
+    is reported back by user id so the caller can retry it on its own.
+    Returns {'sent': int, 'failed': [user ids]}.
+    """
+    delivered = set()
+    failed = []
+    messages = list(messages)
+    try:
+        with mail.connect() as connection:
+            for user_id, email, message in messages:
+                if message is None:
+                    failed.append(user_id)
+                    continue
+                try:
+                    connection.send(message)
+                    delivered.add(user_id)
+                except Exception as e:
+                    print(f"Failed to send mail to {email}: {str(e)}")
+                    failed.append(user_id)
+    except Exception as e:
+        # Connecting failed, or the connection died mid-batch
+        print(f"SMTP batch failed: {str(e)}")
+        failed = [user_id for user_id, _, _ in messages if user_id not in delivered]
+    return {'sent': len(delivered), 'failed': failed}
+
+def summarize(kind, results, elapsed):
+    """Fold per-batch results into totals and a messages-per-second rate"""
+    sent = sum(result['sent'] for result in results)
+    failed = sum(len(result['failed']) for result in results)
+    return {
+        'kind': kind,
+        'batches': len(results),
+        'sent': sent,
+        'failed': failed,
+        'seconds': round(elapsed, 3),
+        'per_second': round(sent / elapsed, 2) if elapsed > 0 else None
+    }
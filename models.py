@@ -8,6 +8,10 @@ class UserRoles(db.Model):
     id = db.Column(db.Integer, primary_key = True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     role_id = db.Column(db.Integer, db.ForeignKey('role.id'))
+    __table_args__ = (
+        db.Index('uq_user_roles_user_role', 'user_id', 'role_id', unique=True),
+        db.Index('ix_user_roles_role_id', 'role_id'),
+    )
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key = True)
@@ -32,6 +36,9 @@ class Subject(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     description = db.Column(db.String)
+    question_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    attempt_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    top_score = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     chapters = db.relationship('Chapter', backref='subject', lazy=True)
 
 
@@ -40,15 +47,21 @@ class Quiz(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id'), nullable=False)
-    date_of_quiz = db.Column(db.Date)
+    date_of_quiz = db.Column(db.Date, index=True)
     time_duration = db.Column(db.Integer)
     remarks = db.Column(db.String)
+    question_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    attempt_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     questions = db.relationship('Questions', backref='quiz', lazy=True)
     scores = db.relationship('Scores', backref='quiz', lazy=True)
+    __table_args__ = (
+        # Covers the chapter -> quiz step of the subject aggregation joins
+        db.Index('ix_quiz_chapter_id_id', 'chapter_id', 'id'),
+    )
     
 class Questions(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False, index=True)
     question_statement = db.Column(db.String, nullable=False)
     option1 = db.Column(db.String, nullable=False)
     option2 = db.Column(db.String, nullable=False)
@@ -60,10 +73,26 @@ class Scores(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     time_stamp_of_attempt = db.Column(db.DateTime)
     total_scored = db.Column(db.Integer)
+    __table_args__ = (
+        db.Index('ix_scores_user_quiz_time', 'user_id', 'quiz_id', 'time_stamp_of_attempt'),
+        db.Index('ix_scores_quiz_total', 'quiz_id', 'total_scored'),
+        db.Index('ix_scores_time_stamp_of_attempt', 'time_stamp_of_attempt'),
+    )
 
 class Chapter(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     description = db.Column(db.String)
     subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False) 
-    quizzes = db.relationship('Quiz', backref='chapter', lazy=True)
\ No newline at end of file
+    question_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    attempt_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    quizzes = db.relationship('Quiz', backref='chapter', lazy=True)
+    __table_args__ = (
+        db.Index('ix_chapter_subject_id_id', 'subject_id', 'id'),
+    )
+
+class UserSubjectStats(db.Model):
+    # Rollup of Scores per learner and subject, kept current by counters.add_attempt
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'), primary_key=True)
+    attempt_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
@@ -0,0 +1,88 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as PoolTimeout
+from flask import current_app
+from flask_security.utils import get_hmac, use_double_hash
+
+PASSWORD_HASH = os.environ.get('PASSWORD_HASH', 'bcrypt')
+# Unset keeps the scheme's own default; when set, hashes at any other cost are
+# rehashed on the next successful login
+PASSWORD_HASH_ROUNDS = os.environ.get('PASSWORD_HASH_ROUNDS')
+# 0 hashes in the request thread; otherwise at most this many hashes run at once
+PASSWORD_POOL_WORKERS = int(os.environ.get('PASSWORD_POOL_WORKERS', 0))
+# Hashes allowed to wait for a pool thread before new logins are turned away
+PASSWORD_POOL_QUEUE = int(os.environ.get('PASSWORD_POOL_QUEUE', 4 * max(PASSWORD_POOL_WORKERS, 1)))
+PASSWORD_POOL_TIMEOUT = float(os.environ.get('PASSWORD_POOL_TIMEOUT', 10))
+
+class PasswordPoolFull(Exception):
+    """Raised when the hashing pool has no room for another login"""
+
+def configure_hashing(app):
+    """Set Flask-Security's hashing scheme and cost; call before Security(app)"""
+    app.config['SECURITY_PASSWORD_HASH'] = PASSWORD_HASH
+    options = {'argon2__rounds': 10}
+    if PASSWORD_HASH_ROUNDS:
+        rounds = int(PASSWORD_HASH_ROUNDS)
+        for option in ('rounds', 'min_rounds', 'max_rounds'):
+            options[f'{PASSWORD_HASH}__{option}'] = rounds
+    app.config['SECURITY_PASSWORD_HASH_PASSLIB_OPTIONS'] = options
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool, _slots
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _slots = threading.BoundedSemaphore(PASSWORD_POOL_WORKERS + PASSWORD_POOL_QUEUE)
+                _pool = ThreadPoolExecutor(max_workers=PASSWORD_POOL_WORKERS, thread_name_prefix='password-hash')
+    return _pool, _slots
+
+def _run(fn, *args):
+    """Run a hashing call inline or on the bounded pool"""
+    if PASSWORD_POOL_WORKERS <= 0:
+        return fn(*args)
+    pool, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise PasswordPoolFull()
+    try:
+        future = pool.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda f: slots.release())
+    try:
+        return future.result(timeout=PASSWORD_POOL_TIMEOUT)
+    except PoolTimeout:
+        raise PasswordPoolFull()
+
+def _hash_secret(password):
+    return get_hmac(password).decode('ascii') if use_double_hash() else password
+
+def _verify(context, secret, stored_hash, new_secret):
+    verified = context.verify(secret, stored_hash)
+    if verified and context.needs_update(stored_hash):
+        return verified, context.hash(new_secret)
+    return verified, None
+
+def check_password(password, user):
+    """Verify a login password, rehashing it when the scheme or cost changed.
+
+    Returns True if it matches; the caller commits, since user.password may
+    have been replaced. Raises PasswordPoolFull when the pool is saturated.
+    """
+    if not user.password:
+        return False
+    context = current_app.extensions['security'].pwd_context
+    secret = get_hmac(password) if use_double_hash(user.password) else password
+    verified, new_hash = _run(_verify, context, secret, user.password, _hash_secret(password))
+    if new_hash:
+        user.password = new_hash
+    return verified
+
+def hash_new_password(password):
+    """Hash a password for storage, on the pool when one is configured"""
+    context = current_app.extensions['security'].pwd_context
+    return _run(context.hash, _hash_secret(password))
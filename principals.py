@@ -0,0 +1,103 @@
+import os
+import time
+from flask import g
+from flask_security import UserMixin
+from flask_security.utils import config_value, get_request_attr, set_request_attr, parse_auth_token
+from cache_tags import cached_value, register_prefix, principal_tag, ROLES_TAG
+from models import User
+
+# Entries roll over after this long even if nothing invalidates them
+PRINCIPAL_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL', 300))
+PRINCIPAL_PREFIX = 'principal'
+
+register_prefix(PRINCIPAL_PREFIX)
+
+class PrincipalRole:
+    """Role name as carried by a cached principal"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_permissions(self):
+        return set()
+
+    def __eq__(self, other):
+        return getattr(other, 'name', other) == self.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+class Principal(UserMixin):
+    """Authenticated user rebuilt from the cache instead of a User row.
+
+    Carries only what request handling reads: id, email, the active flag
+    and role names.
+    """
+
+    def __init__(self, data):
+        self.id = data['id']
+        self.email = data['email']
+        self.fs_uniquifier = data['fs_uniquifier']
+        self.active = data['active']
+        self.roles = [PrincipalRole(name) for name in data['roles']]
+
+def _build_principal(fs_uniquifier):
+    user = User.query.filter_by(fs_uniquifier=fs_uniquifier).first()
+    if user is None:
+        return None
+    return {
+        'id': user.id,
+        'email': user.email,
+        'fs_uniquifier': user.fs_uniquifier,
+        'active': bool(user.active),
+        'roles': sorted(role.name for role in user.roles)
+    }
+
+def load_principal(fs_uniquifier):
+    """Principal for a user's fs_uniquifier, from L1 or Redis when warm"""
+    data = cached_value(
+        PRINCIPAL_PREFIX,
+        [principal_tag(fs_uniquifier), ROLES_TAG],
+        lambda: _build_principal(fs_uniquifier),
+        key_parts=[fs_uniquifier, str(int(time.time() // PRINCIPAL_TTL))],
+        timeout=PRINCIPAL_TTL,
+        # A partition of its own, so a login surge cannot evict the catalog entries
+        local=PRINCIPAL_PREFIX
+    )
+    return Principal(data) if data else None
+
+def _session_loader(user_id):
+    principal = load_principal(str(user_id))
+    if principal and principal.active:
+        set_request_attr("fs_authn_via", "session")
+        return principal
+    return None
+
+def _token_loader(request):
+    if get_request_attr("fs_authn_via") == "token":
+        return g._login_user
+
+    args_key = config_value("TOKEN_AUTHENTICATION_KEY")
+    token = request.args.get(args_key, request.headers.get(config_value("TOKEN_AUTHENTICATION_HEADER")))
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        if isinstance(data, dict):
+            token = data.get(args_key, token)
+
+    try:
+        # Signature and expiry are still checked on every request; only the
+        # user lookup is cached
+        tdata = parse_auth_token(token)
+        principal = load_principal(tdata["uid"])
+    except Exception:
+        return None
+
+    if principal and principal.active:
+        set_request_attr("fs_authn_via", "token")
+        return principal
+    return None
+
+def init_app(app):
+    """Resolve session and token logins through the principal cache"""
+    app.login_manager.user_loader(_session_loader)
+    app.login_manager.request_loader(_token_loader)
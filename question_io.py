@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+from collections import Counter
+from flask import current_app
+from sqlalchemy import insert
+from models import Quiz, Questions, db
+import counters
+from cache_tags import invalidate_tags, quiz_questions_tag
+
+QUESTION_COLUMNS = ['quiz_id', 'question_statement', 'option1', 'option2', 'correct_answer']
+EXPORT_COLUMNS = ['id'] + QUESTION_COLUMNS
+FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+def detect_format(filename, default='csv'):
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+def iter_rows(stream, fmt):
+    """Yield (line number, row dict or None, error or None) from a text stream without reading it all"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == 'jsonl':
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, None, f"Invalid JSON: {str(e)}"
+                continue
+            if not isinstance(row, dict):
+                yield line_num, None, "Expected a JSON object"
+                continue
+            yield line_num, row, None
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+def validate_row(row):
+    """Check a row against the Questions columns; returns (values, error)"""
+    values = {}
+    for column in QUESTION_COLUMNS:
+        value = row.get(column)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return None, f"Missing {column}"
+        values[column] = value
+    try:
+        values['quiz_id'] = int(values['quiz_id'])
+    except (TypeError, ValueError):
+        return None, "quiz_id must be an integer"
+    for column in QUESTION_COLUMNS[1:]:
+        values[column] = str(values[column])
+    return values, None
+
+def _chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def import_questions(stream, fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Insert questions from a CSV/JSONL text stream, one transaction per chunk.
+
+    Caches are invalidated once after the last chunk rather than per row.
+    """
+    report = {'inserted': 0, 'failed': 0, 'chunks': 0, 'errors': []}
+    known_quizzes = set()
+    touched_quizzes = set()
+
+    def add_error(line_num, message):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line_num, 'error': message})
+
+    try:
+        for chunk in _chunks(iter_rows(stream, fmt), chunk_size):
+            _import_chunk(chunk, report, known_quizzes, touched_quizzes, add_error)
+    except (csv.Error, UnicodeDecodeError) as e:
+        # Chunks before the unreadable line stay committed
+        add_error(None, f"Could not parse upload: {str(e)}")
+
+    if touched_quizzes:
+        tags = ['questions', *[quiz_questions_tag(quiz_id) for quiz_id in sorted(touched_quizzes)]]
+        try:
+            invalidate_tags(*tags)
+        except Exception as e:
+            # The rows are committed; failing here would invite a retry that duplicates them
+            current_app.logger.error(f"Cache invalidation failed for {tags}: {str(e)}")
+    report['errors'].sort(key=lambda e: (e['line'] is None, e['line'] or 0))
+    return report
+
+def _import_chunk(chunk, report, known_quizzes, touched_quizzes, add_error):
+    report['chunks'] += 1
+    valid = []
+    for line_num, row, error in chunk:
+        if error is None:
+            values, error = validate_row(row)
+        if error:
+            add_error(line_num, error)
+        else:
+            valid.append((line_num, values))
+
+    # One lookup per chunk for quiz ids we have not seen yet
+    unseen = {values['quiz_id'] for _, values in valid} - known_quizzes
+    if unseen:
+        known_quizzes.update(
+            quiz_id for (quiz_id,) in db.session.query(Quiz.id).filter(Quiz.id.in_(unseen))
+        )
+    rows = []
+    for line_num, values in valid:
+        if values['quiz_id'] in known_quizzes:
+            rows.append(values)
+        else:
+            add_error(line_num, f"Quiz {values['quiz_id']} not found")
+
+    if not rows:
+        return
+
+    try:
+        db.session.execute(insert(Questions), rows)
+        for quiz_id, count in Counter(row['quiz_id'] for row in rows).items():
+            counters.adjust_question_count(quiz_id, count)
+        db.session.commit()
+        report['inserted'] += len(rows)
+        touched_quizzes.update(row['quiz_id'] for row in rows)
+    except Exception as e:
+        db.session.rollback()
+        for line_num, values in valid:
+            if values['quiz_id'] in known_quizzes:
+                add_error(line_num, f"Chunk failed: {str(e)}")
+
+def iter_questions(quiz_id=None, batch_size=DEFAULT_CHUNK_SIZE):
+    query = db.session.query(*[getattr(Questions, column) for column in EXPORT_COLUMNS])
+    if quiz_id:
+        query = query.filter(Questions.quiz_id == quiz_id)
+    return query.order_by(Questions.id).yield_per(batch_size)
+
+def export_questions(fmt, quiz_id=None):
+    """Yield the question bank as CSV or JSONL text, one row at a time"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+    for row in iter_questions(quiz_id):
+        if fmt == 'csv':
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            yield buffer.getvalue()
+        else:
+            yield json.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n'
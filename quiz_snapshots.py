@@ -0,0 +1,83 @@
+import gzip
+import hashlib
+import json
+import os
+from datetime import date, timedelta
+from functools import wraps
+from flask import request, Response
+from cache_tags import cached_value, register_prefix, request_args_key
+from models import Quiz
+
+# Quizzes dated within this many days are warmed by the beat job
+SNAPSHOT_LEAD_DAYS = int(os.environ.get('QUIZ_SNAPSHOT_LEAD_DAYS', 1))
+SNAPSHOT_GZIP = os.environ.get('QUIZ_SNAPSHOT_GZIP', 'true').lower() == 'true'
+# Smaller bodies are not worth a compressed copy
+SNAPSHOT_MIN_GZIP_BYTES = 1024
+# The quiz list HomeUser opens with, warmed alongside each quiz's questions
+STUDENT_QUIZ_LIST_ARGS = {'include_questions': 'false', 'limit': '20'}
+
+def build_snapshot(payload):
+    """Encode a payload once, with its strong ETag and an optional gzip copy"""
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    snapshot = {'body': body, 'etag': hashlib.sha256(body).hexdigest()[:32], 'gzip': None}
+    if SNAPSHOT_GZIP and len(body) >= SNAPSHOT_MIN_GZIP_BYTES:
+        # mtime=0 keeps the compressed bytes identical across rebuilds
+        snapshot['gzip'] = gzip.compress(body, mtime=0)
+    return snapshot
+
+def snapshot_response(snapshot):
+    """Serve a snapshot's bytes as-is, answering If-None-Match with 304"""
+    body, etag = snapshot['body'], snapshot['etag']
+    use_gzip = snapshot['gzip'] is not None and 'gzip' in request.accept_encodings
+    if use_gzip:
+        body, etag = snapshot['gzip'], f"{etag}-gz"
+    response = Response(body, mimetype='application/json')
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+def snapshot_by_tags(name, tags, stale=False):
+    """Cache a payload as a pre-encoded snapshot keyed by the query string and tag versions.
+
+    Any change to a tag makes a new snapshot, so a stored one never changes
+    and its ETag is strong. Error tuples pass through uncached.
+    """
+    key_prefix = f'snapshot:{name}'
+    register_prefix(key_prefix)
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            def build():
+                rv = f(*args, **kwargs)
+                return rv if isinstance(rv, tuple) else build_snapshot(rv)
+
+            entry_tags = tags() if callable(tags) else tags
+            rv = cached_value(key_prefix, entry_tags, build, key_parts=[request_args_key()],
+                              local=True, stale=stale)
+            return rv if isinstance(rv, tuple) else snapshot_response(rv)
+        return wrapper
+    return decorator
+
+def upcoming_quiz_ids(today=None):
+    today = today or date.today()
+    return [quiz_id for quiz_id, in Quiz.query.with_entities(Quiz.id).filter(
+        Quiz.date_of_quiz >= today,
+        Quiz.date_of_quiz <= today + timedelta(days=SNAPSHOT_LEAD_DAYS)
+    ).order_by(Quiz.id)]
+
+def warm_upcoming(app):
+    """Build snapshots for upcoming quizzes' questions and the student quiz list; returns how many"""
+    import resources
+    quiz_ids = upcoming_quiz_ids()
+    if not quiz_ids:
+        return 0
+    with app.test_request_context('/api/quizzes', query_string=STUDENT_QUIZ_LIST_ARGS):
+        resources.quiz_page()
+    for quiz_id in quiz_ids:
+        with app.test_request_context('/api/questions', query_string={'quiz_id': quiz_id}):
+            resources.question_list()
+    return len(quiz_ids) + 1
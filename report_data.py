@@ -0,0 +1,135 @@
+from datetime import datetime
+from sqlalchemy import func
+from models import User, Role, Subject, Chapter, Quiz, Scores
+
+USER_BATCH_SIZE = 500
+RECENT_ATTEMPTS = 5
+
+def iter_user_batches(session, batch_size=USER_BATCH_SIZE):
+    """Yield lists of (id, email, full_name) for learners, keyset-paged by id"""
+    last_id = 0
+    while True:
+        batch = session.query(User.id, User.email, User.full_name).join(User.roles).filter(
+            Role.name == 'user',
+            User.id > last_id
+        ).order_by(User.id).limit(batch_size).all()
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+def count_learners(session):
+    return session.query(func.count(User.id)).join(User.roles).filter(Role.name == 'user').scalar()
+
+def load_users(session, user_ids):
+    return session.query(User.id, User.email, User.full_name).filter(
+        User.id.in_(user_ids)
+    ).order_by(User.id).all()
+
+def load_quiz_catalog(session):
+    """Every quiz with its chapter, subject and stored question count, in id order"""
+    return session.query(
+        Quiz.id,
+        Quiz.name,
+        Chapter.name.label('chapter_name'),
+        Subject.name.label('subject_name'),
+        Quiz.question_count
+    ).join(Quiz.chapter).join(Chapter.subject).order_by(Quiz.id).all()
+
+def attempt_summaries(session, user_ids):
+    """Attempted quiz ids, attempt count and score total per user, from one grouped query"""
+    summaries = {user_id: {'quiz_ids': set(), 'attempts': 0, 'total_scored': 0} for user_id in user_ids}
+    rows = session.query(
+        Scores.user_id,
+        Scores.quiz_id,
+        func.count(Scores.id),
+        func.sum(Scores.total_scored)
+    ).filter(Scores.user_id.in_(user_ids)).group_by(Scores.user_id, Scores.quiz_id)
+    for user_id, quiz_id, attempts, total_scored in rows:
+        summary = summaries[user_id]
+        summary['quiz_ids'].add(quiz_id)
+        summary['attempts'] += attempts
+        summary['total_scored'] += total_scored or 0
+    return summaries
+
+def previous_month(now=None):
+    """[start, end) of the calendar month before ``now``"""
+    now = now or datetime.now()
+    end = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if end.month == 1:
+        start = end.replace(year=end.year - 1, month=12)
+    else:
+        start = end.replace(month=end.month - 1)
+    return start, end
+
+def _in_month(start, end):
+    return [Scores.time_stamp_of_attempt >= start, Scores.time_stamp_of_attempt < end]
+
+def monthly_subject_stats(session, user_ids, start, end):
+    """Attempt count, total, average and best score per user and subject, ordered by user"""
+    return session.query(
+        Scores.user_id,
+        Subject.id.label('subject_id'),
+        Subject.name.label('subject_name'),
+        func.count(Scores.id).label('count'),
+        func.sum(Scores.total_scored).label('total'),
+        func.avg(Scores.total_scored).label('average'),
+        func.max(Scores.total_scored).label('best')
+    ).join(Quiz, Scores.quiz_id == Quiz.id).join(Chapter, Quiz.chapter_id == Chapter.id).join(
+        Subject, Chapter.subject_id == Subject.id
+    ).filter(
+        Scores.user_id.in_(user_ids), *_in_month(start, end)
+    ).group_by(Scores.user_id, Subject.id, Subject.name).order_by(Scores.user_id, Subject.name)
+
+def monthly_recent_attempts(session, user_ids, start, end, limit=RECENT_ATTEMPTS):
+    """The latest ``limit`` attempts per user and subject, ranked in SQL"""
+    ranked = session.query(
+        Scores.user_id,
+        Chapter.subject_id,
+        Quiz.name.label('quiz_name'),
+        Quiz.question_count,
+        Scores.total_scored,
+        Scores.time_stamp_of_attempt,
+        func.row_number().over(
+            partition_by=(Scores.user_id, Chapter.subject_id),
+            order_by=(Scores.time_stamp_of_attempt.desc(), Scores.id.desc())
+        ).label('position')
+    ).join(Quiz, Scores.quiz_id == Quiz.id).join(Chapter, Quiz.chapter_id == Chapter.id).filter(
+        Scores.user_id.in_(user_ids), *_in_month(start, end)
+    ).subquery()
+    return session.query(ranked).filter(ranked.c.position <= limit).order_by(
+        ranked.c.user_id, ranked.c.subject_id, ranked.c.position
+    )
+
+def iter_monthly_reports(session, user_ids, start, end):
+    """Yield (user id, report) for each user in ``user_ids`` that has a row in the month.
+
+    A report is {'count', 'average', 'best', 'subjects': [...]}, each subject
+    carrying its own count/average/best and its recent attempts.
+    """
+    recent = {}
+    for row in monthly_recent_attempts(session, user_ids, start, end):
+        recent.setdefault((row.user_id, row.subject_id), []).append(row)
+
+    current_id, report = None, None
+    for row in monthly_subject_stats(session, user_ids, start, end):
+        if row.user_id != current_id:
+            if report:
+                yield current_id, _finish_report(report)
+            current_id, report = row.user_id, {'count': 0, 'total': 0, 'best': 0, 'subjects': []}
+        report['count'] += row.count
+        report['total'] += row.total or 0
+        report['best'] = max(report['best'], row.best or 0)
+        report['subjects'].append({
+            'name': row.subject_name,
+            'count': row.count,
+            'average': row.average or 0,
+            'best': row.best or 0,
+            'recent': recent.get((row.user_id, row.subject_id), [])
+        })
+    if report:
+        yield current_id, _finish_report(report)
+
+def _finish_report(report):
+    report['average'] = report.pop('total') / report['count']
+    return report
@@ -1,10 +1,18 @@
-from flask_restful import Resource, Api, reqparse, marshal_with, fields
+from flask_restful import Resource, Api, reqparse, marshal_with, marshal, fields, inputs
 from models import Subject, Quiz, Questions, Scores, Chapter, db
 from flask_security import auth_required, current_user, roles_required
 from datetime import datetime, timezone
-from extensions import cache
-from workers import generate_user_export
-from flask import current_app
+from sqlalchemy.orm import selectinload
+from cache_tags import cached_by_tags, user_scores_tag, quiz_questions_tag
+from catalog import build_subject_catalog
+from quiz_snapshots import snapshot_by_tags
+import counters
+from flask import current_app, request, Response, stream_with_context, send_file
+import io
+import question_io
+import export_jobs
+from functools import wraps
+from grading import grade_answers
 
 api = Api(prefix='/api')
 
@@ -28,25 +36,27 @@ quiz_fields = {
     'time_duration': fields.Integer,
     'remarks': fields.String,
     'name': fields.String,
-    'questions': fields.List(fields.Nested({
-        'id': fields.Integer,
-        'quiz_id': fields.Integer,
-        'question_statement': fields.String,
-        'option1': fields.String,
-        'option2': fields.String,
-        'correct_answer': fields.String
-    }))
+    'question_count': fields.Integer
 }
 
+# Answer keys only go to admins; everyone else is graded server-side
 question_fields = {
     'id': fields.Integer,
     'quiz_id': fields.Integer,
     'question_statement': fields.String,
     'option1': fields.String,
-    'option2': fields.String,
-    'correct_answer': fields.String
+    'option2': fields.String
 }
 
+question_answer_fields = dict(question_fields, correct_answer=fields.String)
+
+quiz_summary_fields = dict(quiz_fields)
+quiz_fields = dict(quiz_summary_fields, questions=fields.List(fields.Nested(question_fields)))
+quiz_answer_fields = dict(quiz_summary_fields, questions=fields.List(fields.Nested(question_answer_fields)))
+
+QUIZ_PAGE_DEFAULT_LIMIT = 20
+QUIZ_PAGE_MAX_LIMIT = 100
+
 score_fields = {
     'id': fields.Integer,
     'user_id': fields.Integer,
@@ -55,41 +65,138 @@ score_fields = {
     'total_scored': fields.Integer
 }
 
+submission_fields = dict(score_fields, question_count=fields.Integer)
+
+def wants_answers():
+    return request.args.get('include_answers', 'false').lower() in ('true', '1', 'yes')
+
+def answers_require_admin(f):
+    """Reject include_answers for non-admins before any cached entry can be served"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if wants_answers() and not current_user.has_role('admin'):
+            return {"message": "Only admins can view correct answers"}, 403
+        return f(*args, **kwargs)
+    return wrapper
+
+def question_tags():
+    quiz_id = request.args.get('quiz_id', type=int)
+    if quiz_id:
+        return [quiz_questions_tag(quiz_id)]
+    return ['questions']
+
+@snapshot_by_tags('quiz_list', ['quiz', 'questions'], stale=True)
+def quiz_page():
+    get_parser = reqparse.RequestParser()
+    get_parser.add_argument('cursor', type=int, location='args', required=False)
+    get_parser.add_argument('limit', type=inputs.int_range(1, QUIZ_PAGE_MAX_LIMIT), location='args',
+                            default=QUIZ_PAGE_DEFAULT_LIMIT)
+    get_parser.add_argument('chapter_id', type=int, location='args', required=False)
+    get_parser.add_argument('subject_id', type=int, location='args', required=False)
+    get_parser.add_argument('date_from', type=inputs.date, location='args', required=False)
+    get_parser.add_argument('date_to', type=inputs.date, location='args', required=False)
+    get_parser.add_argument('include_questions', type=inputs.boolean, location='args', default=True)
+    args = get_parser.parse_args()
+
+    query = Quiz.query
+    if args['chapter_id']:
+        query = query.filter(Quiz.chapter_id == args['chapter_id'])
+    if args['subject_id']:
+        query = query.join(Chapter, Chapter.id == Quiz.chapter_id).filter(
+            Chapter.subject_id == args['subject_id']
+        )
+    if args['date_from']:
+        query = query.filter(Quiz.date_of_quiz >= args['date_from'].date())
+    if args['date_to']:
+        query = query.filter(Quiz.date_of_quiz <= args['date_to'].date())
+    if args['cursor']:
+        query = query.filter(Quiz.id > args['cursor'])
+    if args['include_questions']:
+        query = query.options(selectinload(Quiz.questions))
+
+    # One extra row tells us whether another page exists
+    quizzes = query.order_by(Quiz.id).limit(args['limit'] + 1).all()
+    next_cursor = None
+    if len(quizzes) > args['limit']:
+        quizzes = quizzes[:args['limit']]
+        next_cursor = quizzes[-1].id
+
+    if not args['include_questions']:
+        page_fields = quiz_summary_fields
+    elif wants_answers():
+        page_fields = quiz_answer_fields
+    else:
+        page_fields = quiz_fields
+
+    return {
+        'quizzes': marshal(quizzes, page_fields),
+        'next_cursor': next_cursor
+    }
+
+@snapshot_by_tags('question_list', question_tags, stale=True)
+def question_list():
+    get_parser = reqparse.RequestParser()
+    get_parser.add_argument('quiz_id', type=int, location='args', required=False)
+    args = get_parser.parse_args()
+
+    if args.get('quiz_id'):
+        questions = Questions.query.filter_by(quiz_id=args['quiz_id']).all()
+    else:
+        questions = Questions.query.all()
+    return marshal(questions, question_answer_fields if wants_answers() else question_fields)
+
+def open_quiz(quiz_id):
+    """The quiz if it exists and still accepts submissions, or an error response"""
+    quiz = Quiz.query.get(quiz_id)
+    if not quiz:
+        return {"message": "Quiz not found"}, 404
+
+    quiz_datetime = datetime.combine(quiz.date_of_quiz, datetime.min.time()).replace(tzinfo=timezone.utc)
+    current_time = datetime.now(timezone.utc)
+    
+    if quiz_datetime < current_time:
+        current_app.logger.warning(f"Attempt to submit expired quiz {quiz.id} by user {current_user.id}")
+        return {"message": "This quiz has expired and cannot be submitted"}, 403
+    return quiz
+
+def record_attempt(quiz_id, total_scored, time_stamp_of_attempt):
+    """Save the current user's score for an open quiz, or return an error response"""
+    quiz = open_quiz(quiz_id)
+    if isinstance(quiz, tuple):
+        return quiz
+
+    try:
+        time_stamp = datetime.fromisoformat(time_stamp_of_attempt.replace('Z', '+00:00'))
+    except ValueError:
+        return {"message": "Invalid timestamp format"}, 400
+    
+    score = Scores(
+        quiz_id=quiz_id,
+        user_id=current_user.id,
+        time_stamp_of_attempt=time_stamp,
+        total_scored=total_scored
+    )
+    
+    try:
+        db.session.add(score)
+        counters.add_attempt(score.quiz_id, current_user.id, total_scored)
+        db.session.commit()
+        return score
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error saving score: {str(e)}")
+        return {"message": "Failed to save score"}, 500
+
 class SubjectResource(Resource):
     def __init__(self):
         self.parser = reqparse.RequestParser()
         self.parser.add_argument('name', type=str, help="Name should be string", required=True)
 
     @auth_required('token', 'session')
+    @cached_by_tags('subject_list', ['subject', 'chapter', 'questions'], local=True, stale=True)
     @marshal_with(subject_fields)
-    @cache.cached(timeout=1, key_prefix='subject_list')
     def get(self):
-        subjects = Subject.query.all()
-        result = []
-        for subject in subjects:
-            subject_data = {
-                'id': subject.id,
-                'name': subject.name,
-                'chapters': []
-            }
-            
-            chapters = Chapter.query.filter_by(subject_id=subject.id).all()
-            for chapter in chapters:
-                total_questions = 0
-                quizzes = Quiz.query.filter_by(chapter_id=chapter.id).all()
-                for quiz in quizzes:
-                    total_questions += Questions.query.filter_by(quiz_id=quiz.id).count()
-                
-                chapter_data = {
-                    'id': chapter.id,
-                    'name': chapter.name,
-                    'description': chapter.description,
-                    'question_count': total_questions
-                }
-                subject_data['chapters'].append(chapter_data)
-            
-            result.append(subject_data)
-        return result
+        return build_subject_catalog()
 
     @auth_required('token', 'session')
     @marshal_with(subject_fields)
@@ -98,7 +205,6 @@ class SubjectResource(Resource):
         subject = Subject(name=args['name'])
         db.session.add(subject)
         db.session.commit()
-        cache.delete('subject_list')
         return subject
 
     @auth_required('token', 'session')
@@ -110,7 +216,6 @@ class SubjectResource(Resource):
             return {"message": "subject not found"}, 404
         subject.name = args['name']
         db.session.commit()
-        cache.delete('subject_list')
         return subject
 
     @auth_required('token', 'session')
@@ -119,9 +224,9 @@ class SubjectResource(Resource):
         if not subject:
             return {"message": "subject not found"}, 404
         try:
+            counters.remove_subject_rollups(subject.id)
             db.session.delete(subject)
             db.session.commit()
-            cache.delete('subject_list')
             return {"message": "Subject deleted"}, 200
         except Exception as e:
             db.session.rollback()
@@ -137,13 +242,9 @@ class QuizResource(Resource):
         self.parser.add_argument('remarks', type=str, required=False)
 
     @auth_required('token', 'session')
-    @marshal_with(quiz_fields)
-    @cache.cached(timeout=1, key_prefix='quiz_list')
+    @answers_require_admin
     def get(self):
-        quizzes = Quiz.query.all()
-        for quiz in quizzes:
-            quiz.questions = Questions.query.filter_by(quiz_id=quiz.id).all()
-        return quizzes
+        return quiz_page()
 
     @auth_required('token', 'session')
     @marshal_with(quiz_fields)
@@ -172,7 +273,6 @@ class QuizResource(Resource):
         db.session.add(quiz)
         db.session.commit()
         quiz.questions = []
-        cache.delete('quiz_list')
         return quiz
 
 class QuestionResource(Resource):
@@ -185,34 +285,26 @@ class QuestionResource(Resource):
         self.parser.add_argument('correct_answer', type=str, required=True)
 
     @auth_required('token', 'session')
-    @marshal_with(question_fields)
-    @cache.cached(timeout=1)
+    @answers_require_admin
     def get(self):
-        get_parser = reqparse.RequestParser()
-        get_parser.add_argument('quiz_id', type=int, location='args', required=False)
-        args = get_parser.parse_args()
-        
-        if args.get('quiz_id'):
-            return Questions.query.filter_by(quiz_id=args['quiz_id']).all()
-        return Questions.query.all()
+        return question_list()
 
     @auth_required('token', 'session')
-    @marshal_with(question_fields)
+    @marshal_with(question_answer_fields)
     def post(self):
         try:
             args = self.parser.parse_args()
             question = Questions(**args)
             db.session.add(question)
+            counters.adjust_question_count(question.quiz_id, 1)
             db.session.commit()
-            cache.delete_memoized(self.get)
-            cache.delete('quiz_list')
             return question
         except Exception as e:
             db.session.rollback()
             return {"message": str(e)}, 400
 
     @auth_required('token', 'session')
-    @marshal_with(question_fields)
+    @marshal_with(question_answer_fields)
     def put(self, id):
         try:
             args = self.parser.parse_args()
@@ -221,6 +313,10 @@ class QuestionResource(Resource):
             if not question:
                 return {"message": "Question not found"}, 404
 
+            if question.quiz_id != args['quiz_id']:
+                counters.adjust_question_count(question.quiz_id, -1)
+                counters.adjust_question_count(args['quiz_id'], 1)
+
             question.quiz_id = args['quiz_id']
             question.question_statement = args['question_statement']
             question.option1 = args['option1']
@@ -228,8 +324,6 @@ class QuestionResource(Resource):
             question.correct_answer = args['correct_answer']
 
             db.session.commit()
-            cache.delete_memoized(self.get)
-            cache.delete('quiz_list')
             return question
         except Exception as e:
             db.session.rollback()
@@ -241,15 +335,46 @@ class QuestionResource(Resource):
             question = Questions.query.get(id)
             if not question:
                 return {"message": "Question not found"}, 404
+            counters.adjust_question_count(question.quiz_id, -1)
             db.session.delete(question)
             db.session.commit()
-            cache.delete_memoized(self.get)
-            cache.delete('quiz_list')
             return {"message": "Question deleted"}, 200
         except Exception as e:
             db.session.rollback()
             return {"message": f"Failed to delete question: {str(e)}"}, 500
 
+class QuestionBulkResource(Resource):
+    @auth_required('token', 'session')
+    @roles_required('admin')
+    def post(self):
+        upload = request.files.get('file')
+        filename = upload.filename if upload else None
+        fmt = request.args.get('format') or question_io.detect_format(filename)
+        if fmt not in question_io.FORMATS:
+            return {"message": f"Unsupported format: {fmt}"}, 400
+        chunk_size = request.args.get('chunk_size', question_io.DEFAULT_CHUNK_SIZE, type=int)
+        if chunk_size <= 0:
+            return {"message": "chunk_size must be positive"}, 400
+
+        raw = upload.stream if upload else request.stream
+        stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+        report = question_io.import_questions(stream, fmt, chunk_size)
+        return report, 200 if not report['failed'] else 207
+
+    @auth_required('token', 'session')
+    @roles_required('admin')
+    def get(self):
+        fmt = request.args.get('format', 'csv')
+        if fmt not in question_io.FORMATS:
+            return {"message": f"Unsupported format: {fmt}"}, 400
+        quiz_id = request.args.get('quiz_id', type=int)
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        return Response(
+            stream_with_context(question_io.export_questions(fmt, quiz_id)),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=questions.{fmt}'}
+        )
+
 class ChapterResource(Resource):
     def __init__(self):
         self.parser = reqparse.RequestParser()
@@ -258,8 +383,8 @@ class ChapterResource(Resource):
         self.parser.add_argument('description', type=str, required=False)
 
     @auth_required('token', 'session')
+    @cached_by_tags('chapter_list', ['chapter', 'questions'], local=True)
     @marshal_with(chapter_fields)
-    @cache.cached(timeout=1, key_prefix='chapter_list')
     def get(self):
         return Chapter.query.all()
 
@@ -279,8 +404,6 @@ class ChapterResource(Resource):
         )
         db.session.add(chapter)
         db.session.commit()
-        cache.delete('chapter_list')
-        cache.delete('subject_list')
         return chapter
 
     @auth_required('token', 'session')
@@ -289,10 +412,9 @@ class ChapterResource(Resource):
         if not chapter:
             return {"message": "Chapter not found"}, 404
         try:
+            counters.remove_chapter_counts(chapter)
             db.session.delete(chapter)
             db.session.commit()
-            cache.delete('chapter_list')
-            cache.delete('subject_list')
             return {"message": "Chapter deleted"}, 200
         except Exception as e:
             db.session.rollback()
@@ -311,85 +433,102 @@ class ChapterResource(Resource):
         chapter.description = args.get('description')
         try:
             db.session.commit()
-            cache.delete('chapter_list')
-            cache.delete('subject_list')
             return chapter
         except Exception as e:
             db.session.rollback()
             return {"message": str(e)}, 400
 
+# Scores are only created by /quizzes/<id>/submit, which grades the answers itself
 class ScoreResource(Resource):
-    def __init__(self):
-        self.parser = reqparse.RequestParser()
-        self.parser.add_argument('quiz_id', type=int, required=True)
-        self.parser.add_argument('total_scored', type=int, required=True)
-        self.parser.add_argument('time_stamp_of_attempt', type=str, required=True)
-
     @auth_required('token', 'session')
+    @cached_by_tags('score_list', lambda: [user_scores_tag()], per_user=True)
     @marshal_with(score_fields)
-    @cache.memoize(timeout=1)
     def get(self):
         user_id = current_user.id
         return Scores.query.filter_by(user_id=user_id).all()
 
+class SubmissionResource(Resource):
+    def __init__(self):
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument('answers', type=dict, location='json', required=True)
+        self.parser.add_argument('time_stamp_of_attempt', type=str, required=True)
+
     @auth_required('token', 'session')
-    def post(self):
+    def post(self, quiz_id):
         args = self.parser.parse_args()
-        
-        quiz = Quiz.query.get(args['quiz_id'])
-        if not quiz:
-            return {"message": "Quiz not found"}, 404
-
-        quiz_datetime = datetime.combine(quiz.date_of_quiz, datetime.min.time()).replace(tzinfo=timezone.utc)
-        current_time = datetime.now(timezone.utc)
-        
-        if quiz_datetime < current_time:
-            current_app.logger.warning(f"Attempt to submit expired quiz {quiz.id} by user {current_user.id}")
-            return {"message": "This quiz has expired and cannot be submitted"}, 403
-        
-        try:
-            time_stamp = datetime.fromisoformat(args['time_stamp_of_attempt'].replace('Z', '+00:00'))
-        except ValueError:
-            return {"message": "Invalid timestamp format"}, 400
-        
-        score = Scores(
-            quiz_id=args['quiz_id'],
-            user_id=current_user.id,
-            time_stamp_of_attempt=time_stamp,
-            total_scored=args['total_scored']
-        )
-        
-        try:
-            db.session.add(score)
-            db.session.commit()
-            cache.delete_memoized(self.get)
-            return marshal_with(score_fields)(lambda: score)()
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f"Error saving score: {str(e)}")
-            return {"message": "Failed to save score"}, 500
+        # Grading an unknown or closed quiz would cache an answer key for nothing
+        quiz = open_quiz(quiz_id)
+        if isinstance(quiz, tuple):
+            return quiz
+        total_scored, question_count = grade_answers(quiz_id, args['answers'])
+        score = record_attempt(quiz_id, total_scored, args['time_stamp_of_attempt'])
+        if isinstance(score, tuple):
+            return score
+        score.question_count = question_count
+        return marshal(score, submission_fields)
 
 class ExportResource(Resource):
     @auth_required('token', 'session')
     @roles_required('admin')
     def post(self):
-        task = None
+        job = None
         try:
-            task = generate_user_export.delay(current_user.email)            
-            cache.delete('export_task')            
+            job, created = export_jobs.claim_export(current_user.email)
+            if not created:
+                return {
+                    'message': 'An export is already running.',
+                    'job': job
+                }, 200
+            from workers import generate_user_export
+            task = generate_user_export.delay(current_user.email, job['id'])
+            job = export_jobs.update_job(job['id'], task_id=str(task.id))
             return {
                 'message': 'Export started. You will receive an email when ready.',
-                'task_id': str(task.id) if task else None
+                'task_id': str(task.id),
+                'job': job
             }, 202
         except Exception as e:
             current_app.logger.error(f"Export error: {str(e)}")
+            if job:
+                export_jobs.fail_job(job['id'], str(e))
             return {
                 'message': f'Export failed: {str(e)}'
             }, 500
 
+class ExportStatusResource(Resource):
+    @auth_required('token', 'session')
+    @roles_required('admin')
+    def get(self, job_id):
+        job = export_jobs.get_job(job_id)
+        if not job:
+            return {'message': 'Export not found'}, 404
+        job = dict(job, downloadable=export_jobs.artifact_path(job) is not None)
+        return job
+
+class ExportDownloadResource(Resource):
+    @auth_required('token', 'session')
+    @roles_required('admin')
+    def get(self, job_id):
+        path = export_jobs.artifact_path(export_jobs.get_job(job_id))
+        if not path:
+            return {'message': 'Export not found or expired'}, 404
+        # conditional=True lets werkzeug answer Range and If-Range requests
+        return send_file(
+            path,
+            mimetype='text/csv',
+            as_attachment=True,
+            download_name='user_export.csv',
+            conditional=True,
+            max_age=0
+        )
+
 api.add_resource(SubjectResource, '/subjects', '/subjects/<int:id>')
 api.add_resource(QuizResource, '/quizzes', '/quizzes/<int:id>')
 api.add_resource(QuestionResource, '/questions', '/questions/<int:id>')
+api.add_resource(QuestionBulkResource, '/questions/bulk')
 api.add_resource(ScoreResource, '/scores', '/scores/<int:id>')
+api.add_resource(SubmissionResource, '/quizzes/<int:quiz_id>/submit')
 api.add_resource(ChapterResource, '/chapters', '/chapters/<int:id>')
 api.add_resource(ExportResource, '/export/users')
+api.add_resource(ExportStatusResource, '/export/users/<string:job_id>')
+api.add_resource(ExportDownloadResource, '/export/users/<string:job_id>/download')
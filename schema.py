@@ -0,0 +1,41 @@
+from sqlalchemy import inspect, text
+from extensions import db
+from models import UserSubjectStats
+import counters
+
+def _dedupe_user_roles():
+    """Drop repeated (user_id, role_id) rows so the unique index can be built"""
+    db.session.execute(text(
+        'DELETE FROM user_roles WHERE id NOT IN '
+        '(SELECT MIN(id) FROM user_roles GROUP BY user_id, role_id)'
+    ))
+    db.session.commit()
+
+def ensure_indexes():
+    """Create model indexes missing from databases built before they were declared"""
+    inspector = inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            if table.name == 'user_roles' and index.unique:
+                _dedupe_user_roles()
+            index.create(db.engine)
+            created.append(index.name)
+    return created
+
+def upgrade_schema():
+    """Bring an existing database up to the current models in place"""
+    new_rollups = not inspect(db.engine).has_table(UserSubjectStats.__tablename__)
+    db.create_all()
+    if not counters.ensure_counter_columns() and new_rollups:
+        # An existing score history has to be folded into the fresh rollup table
+        counters.rebuild_rollups()
+    created = ensure_indexes()
+    if created:
+        print(f"Created indexes: {', '.join(created)}")
+    return created
@@ -5,11 +5,19 @@ if [ -f ".venv/bin/activate" ]; then
 fi
 
 redis-server &
+
+# init-db bumps cache tags, so Redis has to be up before it runs
+until redis-cli ping > /dev/null 2>&1; do
+    sleep 0.2
+done
+
+export FLASK_APP=app.py
+python -m flask init-db
+
 mailhog &
 celery -A workers.celery worker --loglevel=info &
 celery -A workers.celery beat --loglevel=info &
 
-export FLASK_APP=app.py
 export FLASK_DEBUG=1
 python -m flask run
 
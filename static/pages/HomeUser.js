@@ -18,7 +18,7 @@ const HomeUser = {
           <tr v-for="quiz in filteredQuizzes" :key="quiz.id" :class="{'table-secondary': isQuizExpired(quiz)}">
             <td>{{quiz.id}}</td>
             <td>{{quiz.name}}</td>
-            <td>{{quiz.questions.length}}</td>
+            <td>{{quiz.question_count}}</td>
             <td>{{formatDate(quiz.date_of_quiz)}}</td>
             <td>{{quiz.time_duration}}</td>
             <td>
@@ -37,6 +37,9 @@ const HomeUser = {
           </tr>
         </tbody>
       </table>
+      <div v-if="nextCursor" class="text-center mb-4">
+        <button class="btn btn-outline-primary" @click="fetchQuizzes(nextCursor)" :disabled="loadingQuizzes">Load more</button>
+      </div>
 
       <div class="modal fade" id="viewQuizModal" tabindex="-1">
         <div class="modal-dialog">
@@ -49,7 +52,7 @@ const HomeUser = {
               <p><strong>Quiz ID:</strong> {{selectedQuiz.id}}</p>
               <p><strong>Quiz Name:</strong> {{selectedQuiz.name}}</p>
               <p><strong>Chapter:</strong> {{chapters[selectedQuiz.chapter_id]?.name}}</p>
-              <p><strong>Number of Questions:</strong> {{selectedQuiz.questions.length}}</p>
+              <p><strong>Number of Questions:</strong> {{selectedQuiz.question_count}}</p>
               <p><strong>Date:</strong> {{formatDate(selectedQuiz.date_of_quiz)}}</p>
               <p><strong>Duration (in minutes):</strong> {{selectedQuiz.time_duration}}</p>
               <p><strong>Status:</strong> 
@@ -129,6 +132,8 @@ const HomeUser = {
   data() {
     return {
       quizzes: [],
+      nextCursor: null,
+      loadingQuizzes: false,
       chapters: {},
       selectedQuiz: null,
       currentQuiz: null,
@@ -206,9 +211,12 @@ const HomeUser = {
       return quizDate < new Date();
     },
 
-    async fetchQuizzes() {
+    async fetchQuizzes(cursor = null) {
+      this.loadingQuizzes = true;
       try {
-        const response = await fetch('/api/quizzes', {
+        const params = new URLSearchParams({ include_questions: 'false', limit: '20' });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`/api/quizzes?${params}`, {
           headers: {
             'Authentication-Token': this.$store.state.authToken
           }
@@ -216,10 +224,26 @@ const HomeUser = {
         if (!response.ok) {
           throw new Error('Failed to fetch quizzes');
         }
-        this.quizzes = await response.json();
+        const page = await response.json();
+        this.quizzes = cursor ? this.quizzes.concat(page.quizzes) : page.quizzes;
+        this.nextCursor = page.next_cursor;
       } catch (error) {
         console.error('Error fetching quizzes:', error);
+      } finally {
+        this.loadingQuizzes = false;
+      }
+    },
+
+    async fetchQuestions(quizId) {
+      const response = await fetch(`/api/questions?quiz_id=${quizId}`, {
+        headers: {
+          'Authentication-Token': this.$store.state.authToken
+        }
+      });
+      if (!response.ok) {
+        throw new Error('Failed to fetch questions');
       }
+      return response.json();
     },
 
     async fetchChapters() {
@@ -254,12 +278,19 @@ const HomeUser = {
       }
     },
 
-    startQuiz(quiz) {
+    async startQuiz(quiz) {
       if (this.isQuizExpired(quiz)) {
         alert('This quiz has expired and cannot be attempted.');
         return;
       }
-      this.currentQuiz = quiz;
+      try {
+        const questions = await this.fetchQuestions(quiz.id);
+        this.currentQuiz = { ...quiz, questions };
+      } catch (error) {
+        console.error('Error loading quiz questions:', error);
+        alert('Failed to load quiz questions. Please try again.');
+        return;
+      }
       this.currentQuestionIndex = 0;
       this.answers = new Map();
       this.currentAnswer = '';
@@ -310,24 +341,23 @@ const HomeUser = {
         return;
       }
 
-      let totalScore = 0;
+      const answers = {};
       this.currentQuiz.questions.forEach((question, index) => {
-        if (this.answers.get(index) === question.correct_answer) {
-          totalScore++;
+        if (this.answers.has(index)) {
+          answers[question.id] = this.answers.get(index);
         }
       });
 
       try {
-        const response = await fetch('/api/scores', {
+        const response = await fetch(`/api/quizzes/${this.currentQuiz.id}/submit`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
             'Authentication-Token': this.$store.state.authToken
           },
           body: JSON.stringify({
-            quiz_id: this.currentQuiz.id,
-            time_stamp_of_attempt: new Date().toISOString(),
-            total_scored: totalScore
+            answers,
+            time_stamp_of_attempt: new Date().toISOString()
           })
         });
 
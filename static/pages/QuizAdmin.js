@@ -43,6 +43,9 @@ const QuizAdmin = {
                 </table>
             </div>
         </div>
+        <div v-if="nextCursor" class="text-center mb-4">
+            <button class="btn btn-outline-primary" @click="fetchQuizzes(nextCursor)" :disabled="loadingQuizzes">Load more</button>
+        </div>
         <button class="btn btn-primary" @click="openAddQuizModal">Add Quiz</button>
 
         <div class="modal fade" id="questionModal" tabindex="-1" aria-labelledby="questionModalLabel" aria-hidden="true">
@@ -183,6 +186,8 @@ const QuizAdmin = {
     data() {
         return {
             quizzes: [],
+            nextCursor: null,
+            loadingQuizzes: false,
             isQuestionModalActive: false,
             isQuizModalActive: false,
             editingQuestion: null,
@@ -260,17 +265,23 @@ const QuizAdmin = {
         });
     },
     methods: {
-        async fetchQuizzes() {
+        async fetchQuizzes(cursor = null) {
+            this.loadingQuizzes = true;
             try {
-                const response = await fetch('/api/quizzes', {
+                const params = new URLSearchParams({ limit: '10', include_answers: 'true' });
+                if (cursor) params.set('cursor', cursor);
+                const response = await fetch(`/api/quizzes?${params}`, {
                     headers: {
                         'Authentication-Token': store.state.authToken
                     }
                 });
-                const data = await response.json();
-                this.quizzes = data;
+                const page = await response.json();
+                this.quizzes = cursor ? this.quizzes.concat(page.quizzes) : page.quizzes;
+                this.nextCursor = page.next_cursor;
             } catch (error) {
                 console.error('Error fetching quizzes:', error);
+            } finally {
+                this.loadingQuizzes = false;
             }
         },
         async fetchChapters() {
@@ -120,15 +120,23 @@ const ScoreUser = {
     },
     async fetchQuizzes() {
       try {
-        const response = await fetch('/api/quizzes', {
-          headers: {
-            'Authentication-Token': this.$store.state.authToken
+        const quizzes = [];
+        let cursor = null;
+        do {
+          const params = new URLSearchParams({ include_questions: 'false', limit: '100' });
+          if (cursor) params.set('cursor', cursor);
+          const response = await fetch(`/api/quizzes?${params}`, {
+            headers: {
+              'Authentication-Token': this.$store.state.authToken
+            }
+          });
+          if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
           }
-        });
-        if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`);
-        }
-        const quizzes = await response.json();
+          const page = await response.json();
+          quizzes.push(...page.quizzes);
+          cursor = page.next_cursor;
+        } while (cursor);
         this.quizzes = quizzes.reduce((acc, quiz) => {
           acc[quiz.id] = quiz;
           return acc;
@@ -149,7 +157,7 @@ const ScoreUser = {
     },
     getQuestionCount(quizId) {
       const quiz = this.quizzes[quizId];
-      return quiz?.questions?.length || 'N/A';
+      return quiz?.question_count ?? 'N/A';
     },
     sort(field) {
       if (this.sortField === field) {
@@ -1,3 +1,5 @@
+import { fetchChartData, renderBarChart, renderPieChart } from "../utils/charts.js";
+
 const SummaryAdmin = {
   template: `
     <div class="container mt-4">
@@ -25,6 +27,33 @@ const SummaryAdmin = {
         <button type="button" class="btn-close" @click="exportSuccess = false"></button>
       </div>
 
+      <div v-if="exportJob" class="card mb-4">
+        <div class="card-body">
+          <div v-if="exportJob.status === 'queued' || exportJob.status === 'running'">
+            <p class="mb-2">Exporting users... {{ exportJob.processed }} / {{ exportJob.total || '?' }}</p>
+            <div class="progress">
+              <div class="progress-bar" role="progressbar" :style="{ width: exportJob.progress + '%' }">
+                {{ exportJob.progress }}%
+              </div>
+            </div>
+          </div>
+          <div v-else-if="exportJob.status === 'done'" class="d-flex justify-content-between align-items-center">
+            <span>Export ready ({{ exportJob.processed }} users).</span>
+            <a
+              v-if="exportJob.downloadable"
+              class="btn btn-success"
+              :href="'/api/export/users/' + exportJob.id + '/download'"
+            >
+              Download CSV
+            </a>
+            <span v-else class="text-muted">The file has expired.</span>
+          </div>
+          <div v-else class="text-danger">
+            Export failed: {{ exportJob.error }}
+          </div>
+        </div>
+      </div>
+
       <div v-if="error" class="alert alert-danger text-center" role="alert">
         {{ error }}
       </div>
@@ -117,7 +146,9 @@ const SummaryAdmin = {
       lastX: 0,
       lastY: 0,
       isExporting: false,
-      exportSuccess: false
+      exportSuccess: false,
+      exportJob: null,
+      exportPoll: null
     }
   },
   computed: {
@@ -128,17 +159,19 @@ const SummaryAdmin = {
   methods: {
     async fetchCharts() {
       try {
-        const response = await fetch('/api/charts/admin', {
-          headers: {
-            'Authentication-Token': this.$store.state.authToken
-          }
-        })
-        if (!response.ok) {
-          throw new Error('Failed to fetch charts')
+        const data = await fetchChartData('/api/charts/admin/data', this.$store.state.authToken)
+        if (!data.subject_scores) {
+          throw new Error('No score data available')
+        }
+        if (!data.subject_attempts) {
+          throw new Error('No attempt data available')
         }
-        const data = await response.json()
-        this.scoresChart = data.scores_chart + '?t=' + new Date().getTime()
-        this.attemptsChart = data.attempts_chart + '?t=' + new Date().getTime()
+        this.scoresChart = renderBarChart(data.subject_scores, {
+          title: 'Subject-wise Top Scores',
+          xLabel: 'Subjects',
+          yLabel: 'Top Score'
+        })
+        this.attemptsChart = renderPieChart(data.subject_attempts)
         this.error = null
       } catch (err) {
         console.error('Error fetching charts:', err)
@@ -160,11 +193,13 @@ const SummaryAdmin = {
           }
         });
         
+        const data = await response.json();
         if (!response.ok) {
-          const data = await response.json();
           throw new Error(data.message || 'Export failed');
         }
         
+        this.exportJob = data.job;
+        this.pollExport();
         this.exportSuccess = true;
         setTimeout(() => {
           this.exportSuccess = false;
@@ -176,6 +211,28 @@ const SummaryAdmin = {
         this.isExporting = false;
       }
     },
+    async pollExport() {
+      clearTimeout(this.exportPoll);
+      if (!this.exportJob) return;
+      
+      try {
+        const response = await fetch(`/api/export/users/${this.exportJob.id}`, {
+          headers: {
+            'Authentication-Token': this.$store.state.authToken
+          }
+        });
+        if (!response.ok) {
+          throw new Error('Failed to fetch export status');
+        }
+        this.exportJob = await response.json();
+      } catch (error) {
+        console.error('Export status error:', error);
+      }
+      
+      if (['queued', 'running'].includes(this.exportJob.status)) {
+        this.exportPoll = setTimeout(() => this.pollExport(), 2000);
+      }
+    },
     openModal(type) {
       if (type === 'scores') {
         this.modalImage = this.scoresChart
@@ -237,6 +294,9 @@ const SummaryAdmin = {
     
     this.fetchCharts();
     this.modal = new bootstrap.Modal(document.getElementById('chartModalAdmin'));
+  },
+  beforeUnmount() {
+    clearTimeout(this.exportPoll);
   }
 }
 
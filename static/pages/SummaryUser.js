@@ -1,3 +1,5 @@
+import { fetchChartData, renderBarChart, renderPieChart } from "../utils/charts.js";
+
 const SummaryUser = {
   template: `
     <div class="container mt-4">
@@ -101,23 +103,18 @@ const SummaryUser = {
   methods: {
     async fetchCharts() {
       try {
-        const response = await fetch('/api/charts/user', {
-          headers: {
-            'Authentication-Token': this.$store.state.authToken
-          }
-        })
-        if (!response.ok) {
-          if (response.status === 404) {
-            this.noAttempts = true
-            return
-          }
-          throw new Error('Failed to fetch charts')
+        const data = await fetchChartData('/api/charts/user/data', this.$store.state.authToken)
+        if (!data.subject_questions) {
+          throw new Error('No questions data available')
         }
-        const data = await response.json()
-        this.questionsChart = data.questions_chart + '?t=' + new Date().getTime()
-        this.attemptsChart = data.attempts_chart + '?t=' + new Date().getTime()
+        this.questionsChart = renderBarChart(data.subject_questions, {
+          title: 'Subject-wise Number of Questions',
+          xLabel: 'Subjects',
+          yLabel: 'Number of Questions'
+        })
+        this.noAttempts = !data.user_attempts
+        this.attemptsChart = data.user_attempts ? renderPieChart(data.user_attempts) : null
         this.error = null
-        this.noAttempts = false
       } catch (err) {
         console.error('Error fetching charts:', err)
         this.error = 'Error loading charts. Please try again later.'
@@ -1,4 +1,4 @@
-const CACHE_NAME = 'quiz-master-v1';
+const CACHE_NAME = 'quiz-master-v2';
 const OFFLINE_URL = '/offline.html';
 const ASSETS_TO_CACHE = [
     '/',
@@ -9,6 +9,7 @@ const ASSETS_TO_CACHE = [
     'https://cdn.jsdelivr.net/npm/vue@2.7.16/dist/vue.js',
     'https://unpkg.com/vue-router@3/dist/vue-router.js',
     'https://unpkg.com/vuex@3.6.2/dist/vuex.js',
+    'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js',
     'https://cdn.jsdelivr.net/npm/bootstrap@5.2.3/dist/css/bootstrap.min.css',
     'https://cdn.jsdelivr.net/npm/bootstrap@5.2.3/dist/js/bootstrap.bundle.min.js'
 ];
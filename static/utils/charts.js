@@ -0,0 +1,89 @@
+const ETAG_PREFIX = 'chart-data:';
+
+// Fetch chart series, revalidating a stored copy with If-None-Match so
+// unchanged data costs a 304 and no body
+export async function fetchChartData(url, authToken) {
+    const storageKey = ETAG_PREFIX + url;
+    let stored = null;
+    try {
+        stored = JSON.parse(sessionStorage.getItem(storageKey));
+    } catch (e) {
+        stored = null;
+    }
+
+    const headers = { 'Authentication-Token': authToken };
+    if (stored && stored.etag) {
+        headers['If-None-Match'] = stored.etag;
+    }
+
+    const response = await fetch(url, { headers, cache: 'no-store' });
+    if (response.status === 304 && stored) {
+        return stored.data;
+    }
+    if (!response.ok) {
+        throw new Error('Failed to fetch chart data');
+    }
+
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (etag) {
+        try {
+            sessionStorage.setItem(storageKey, JSON.stringify({ etag, data }));
+        } catch (e) {
+            // Storage full or disabled; the next load simply refetches
+        }
+    }
+    return data;
+}
+
+function drawToImage(width, height, config) {
+    const canvas = document.createElement('canvas');
+    canvas.width = width;
+    canvas.height = height;
+    const chart = new Chart(canvas, {
+        ...config,
+        options: { ...config.options, responsive: false, animation: false }
+    });
+    const image = chart.toBase64Image('image/png', 1);
+    chart.destroy();
+    return image;
+}
+
+export function renderBarChart(series, { title, xLabel, yLabel }) {
+    return drawToImage(1000, 600, {
+        type: 'bar',
+        data: {
+            labels: series.labels,
+            datasets: [{ data: series.values, backgroundColor: '#1f77b4' }]
+        },
+        options: {
+            plugins: {
+                legend: { display: false },
+                title: { display: true, text: title }
+            },
+            scales: {
+                x: { title: { display: true, text: xLabel } },
+                y: { beginAtZero: true, title: { display: true, text: yLabel } }
+            }
+        }
+    });
+}
+
+export function renderPieChart(series) {
+    const total = series.values.reduce((sum, value) => sum + value, 0);
+    const labels = series.labels.map((label, i) =>
+        `${label} (${(series.values[i] * 100 / total).toFixed(1)}%)`
+    );
+    return drawToImage(1000, 800, {
+        type: 'pie',
+        data: {
+            labels,
+            datasets: [{ data: series.values }]
+        },
+        options: {
+            plugins: {
+                legend: { position: 'right' }
+            }
+        }
+    });
+}
@@ -0,0 +1,106 @@
+import csv
+import os
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import func, case
+from models import Subject, Chapter, Quiz, Scores
+from report_data import iter_user_batches
+
+EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'quiz-master-exports'))
+EXPORT_BATCH_SIZE = 500
+# Larger files are left on disk instead of being attached to the email
+MAX_ATTACHMENT_BYTES = int(os.environ.get('EXPORT_MAX_ATTACHMENT_BYTES', 10 * 1024 * 1024))
+
+def export_headers(subject_names):
+    headers = [
+        'User ID', 'Name', 'Email',
+        'Total Quizzes', 'Overall Average', 'Best Score',
+        'Recent Quizzes (7 days)', 'Recent Average',
+        'Last Quiz Date'
+    ]
+    for subject in subject_names:
+        headers.extend([
+            f"{subject} Quizzes",
+            f"{subject} Average",
+            f"{subject} Best",
+            f"{subject} Recent"
+        ])
+    return headers
+
+def subject_pivot(session, user_ids, since):
+    """Per (user, subject) attempt count, total, best, recent count/total and last attempt"""
+    is_recent = Scores.time_stamp_of_attempt >= since
+    return session.query(
+        Scores.user_id,
+        Chapter.subject_id,
+        func.count(Scores.id).label('count'),
+        func.sum(Scores.total_scored).label('total'),
+        func.max(Scores.total_scored).label('best'),
+        func.sum(case((is_recent, 1), else_=0)).label('recent_count'),
+        func.sum(case((is_recent, Scores.total_scored), else_=0)).label('recent_total'),
+        func.max(Scores.time_stamp_of_attempt).label('last_attempt')
+    ).join(Quiz, Scores.quiz_id == Quiz.id).join(Chapter, Quiz.chapter_id == Chapter.id).filter(
+        Scores.user_id.in_(user_ids)
+    ).group_by(Scores.user_id, Chapter.subject_id)
+
+def _export_row(user, subject_ids, stats):
+    row = [user.id, user.full_name or 'N/A', user.email]
+    count = sum(s.count for s in stats.values())
+    if count:
+        total = sum(s.total or 0 for s in stats.values())
+        recent_count = sum(s.recent_count for s in stats.values())
+        recent_total = sum(s.recent_total or 0 for s in stats.values())
+        last_attempt = max((s.last_attempt for s in stats.values() if s.last_attempt), default=None)
+        row.extend([
+            count,
+            f"{total/count:.2f}%",
+            f"{max(s.best or 0 for s in stats.values()):.2f}%",
+            recent_count,
+            f"{recent_total/recent_count:.2f}%" if recent_count else "N/A",
+            last_attempt.strftime('%Y-%m-%d %H:%M') if last_attempt else 'Never'
+        ])
+    else:
+        row.extend(['0', '0%', '0%', '0', 'N/A', 'Never'])
+
+    for subject_id in subject_ids:
+        s = stats.get(subject_id)
+        if s:
+            row.extend([
+                s.count,
+                f"{(s.total or 0)/s.count:.2f}%",
+                f"{s.best or 0:.2f}%",
+                f"{s.recent_count} in last 7 days"
+            ])
+        else:
+            row.extend(['0', '0%', '0%', 'No activity'])
+    return row
+
+def iter_export_rows(session, batch_size=EXPORT_BATCH_SIZE, now=None):
+    """Yield the header and then one row per learner, a batch of users at a time"""
+    since = (now or datetime.now()) - timedelta(days=7)
+    subjects = session.query(Subject.id, Subject.name).order_by(Subject.id).all()
+    subject_ids = [s.id for s in subjects]
+    yield export_headers([s.name for s in subjects])
+
+    for batch in iter_user_batches(session, batch_size):
+        stats = {}
+        for row in subject_pivot(session, [user.id for user in batch], since):
+            stats.setdefault(row.user_id, {})[row.subject_id] = row
+        for user in batch:
+            yield _export_row(user, subject_ids, stats.get(user.id, {}))
+
+def write_export(rows):
+    """Write rows to a new CSV file under EXPORT_DIR; returns (path, data rows written)"""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='user_export_', suffix='.csv', dir=EXPORT_DIR)
+    written = -1
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            for row in rows:
+                writer.writerow(row)
+                written += 1
+    except Exception:
+        os.remove(path)
+        raise
+    return path, max(written, 0)
@@ -1,12 +1,12 @@
-from flask import render_template_string, render_template, Flask, request, jsonify
+from flask import render_template, Flask, request, jsonify
 from flask_security import auth_required, current_user, roles_required
 from flask_security import SQLAlchemySessionUserDatastore
-from flask_security.utils import hash_password
-from models import Subject, Chapter, Quiz, Questions, Scores
-from extensions import cache
+import passwords
+from cache_tags import cached_by_tags, user_scores_tag, cache_stats
 import charts
-import os
-from sqlalchemy import or_
+from catalog import build_subject_catalog
+import json
+import hashlib
 from datetime import datetime
 
 def create_views(app: Flask, user_datastore: SQLAlchemySessionUserDatastore, db):
@@ -37,9 +37,10 @@ def create_views(app: Flask, user_datastore: SQLAlchemySessionUserDatastore, db)
 
             try:
                 dob_date = datetime.strptime(dob, '%Y-%m-%d').date()
+                password_hash = passwords.hash_new_password(password)
                 user = user_datastore.create_user(
                     email=email,
-                    password=hash_password(password),
+                    password=password_hash,
                     active=True,
                     roles=['user'],
                     full_name=full_name,
@@ -59,6 +60,8 @@ def create_views(app: Flask, user_datastore: SQLAlchemySessionUserDatastore, db)
                 }), 201
             except ValueError:
                 return jsonify({'message': 'Invalid date format. Please use YYYY-MM-DD format.'}), 400
+            except passwords.PasswordPoolFull:
+                return jsonify({'message': 'Too many sign-ups right now. Please try again in a moment.'}), 503, {'Retry-After': '1'}
             except Exception as e:
                 db.session.rollback()
                 app.logger.error(f"Database error during user creation: {str(e)}")
@@ -67,83 +70,141 @@ def create_views(app: Flask, user_datastore: SQLAlchemySessionUserDatastore, db)
             app.logger.error(f"Registration error: {str(e)}")
             return jsonify({'message': 'An unexpected error occurred. Please try again later.'}), 500
 
+    @cached_by_tags('subject_search', ['subject', 'chapter', 'questions'], query_string=True, local=True)
+    def search_subjects():
+        return build_subject_catalog(request.args.get('search', ''))
+
     @app.route('/api/subjects')
     @auth_required('token', 'session')
-    @cache.memoize(timeout=1)
     def get_subjects():
-        search_query = request.args.get('search', '').lower()
-        subjects = db.session.query(Subject).all()
-        subject_list = []
-        
-        for subject in subjects:
-            chapters = db.session.query(Chapter).filter(Chapter.subject_id == subject.id).all()
-            chapter_list = []
-            
-            for chapter in chapters:
-                total_questions = 0
-                quizzes = db.session.query(Quiz).filter(Quiz.chapter_id == chapter.id).all()
-                for quiz in quizzes:
-                    question_count = db.session.query(Questions).filter(Questions.quiz_id == quiz.id).count()
-                    total_questions += question_count
-
-                if not search_query or \
-                   search_query in chapter.name.lower() or \
-                   (chapter.description and search_query in chapter.description.lower()):
-                    chapter_list.append({
-                        'id': chapter.id,
-                        'name': chapter.name,
-                        'description': chapter.description,
-                        'question_count': total_questions
-                    })
-            
-            if chapter_list or not search_query or search_query in subject.name.lower():
-                subject_list.append({ 'name': subject.name, 'chapters': chapter_list })
-                
-        return jsonify(subject_list)
+        return jsonify(search_subjects())
+
+    # The summary pages draw from the /data endpoints; the PNG endpoints and
+    # their render queue stay for API clients that want ready-made images
+    def chart_response(specs):
+        """Chart URLs once every chart is drawn; until then queue the missing ones and answer 202"""
+        # Touch every file, not just until the first missing one, so none is collected while in use
+        if not all([charts.touch_rendered(spec) for spec in specs.values()]):
+            claimed = charts.claim_renders(specs.values())
+            task = None
+            if claimed:
+                # Celery is only loaded once a chart actually needs drawing
+                from workers import render_charts
+                task = render_charts.delay(claimed)
+            if not all(charts.is_rendered(spec) for spec in specs.values()):
+                return {
+                    'status': 'rendering',
+                    'task_id': str(task.id) if task else None
+                }, 202
+        return {name: charts.chart_url(spec) for name, spec in specs.items()}
+
+    # Specs are cached rather than URLs, since gc_charts may remove a file
+    # while an entry naming it is still live
+    @cached_by_tags('admin_chart_specs', ['subject', 'chapter', 'quiz', 'scores'], timeout=charts.CHART_CACHE_TIMEOUT)
+    def admin_chart_specs():
+        scores_chart = charts.admin_subject_scores()
+        if not scores_chart:
+            return jsonify({'message': 'No score data available'}), 404
+
+        attempts_chart = charts.admin_subject_attempts()
+        if not attempts_chart:
+            return jsonify({'message': 'No attempt data available'}), 404
+
+        return {
+            'scores_chart': scores_chart,
+            'attempts_chart': attempts_chart
+        }
+
+    @cached_by_tags(
+        'user_chart_specs', lambda: ['subject', 'questions', user_scores_tag()],
+        timeout=charts.CHART_CACHE_TIMEOUT, per_user=True
+    )
+    def user_chart_specs():
+        questions_chart = charts.user_subject_questions()
+        attempts_chart = charts.user_subject_attempts(current_user.id)
+
+        if not questions_chart:
+            return jsonify({'message': 'No questions data available'}), 404
+        if not attempts_chart:
+            return jsonify({'message': 'No quiz attempts found'}), 404
+
+        return {
+            'questions_chart': questions_chart,
+            'attempts_chart': attempts_chart
+        }
 
     @app.route('/api/charts/admin')
     @auth_required('token', 'session')
     @roles_required('admin')
-    @cache.memoize(timeout=1)
     def get_admin_charts():
         try:
-            charts.cleanup_charts()
-            
-            scores_chart = charts.generate_admin_subject_scores()
-            if not scores_chart:
-                return jsonify({'message': 'No score data available'}), 404
-                
-            attempts_chart = charts.generate_admin_subject_attempts()
-            if not attempts_chart:
-                return jsonify({'message': 'No attempt data available'}), 404
-            
-            return jsonify({
-                'scores_chart': f'/static/charts/admin/{scores_chart}',
-                'attempts_chart': f'/static/charts/admin/{attempts_chart}'
-            })
+            specs = admin_chart_specs()
+            if isinstance(specs, tuple):
+                return specs
+            return chart_response(specs)
         except Exception as e:
             app.logger.error(f"Error generating admin charts: {str(e)}")
             return jsonify({'message': 'Error generating charts'}), 500
 
     @app.route('/api/charts/user')
     @auth_required('token', 'session')
-    @cache.memoize(timeout=1)
     def get_user_charts():
         try:
-            charts.cleanup_charts()
-            
-            questions_chart = charts.generate_user_subject_questions()
-            attempts_chart = charts.generate_user_subject_attempts(current_user.id)
-            
-            if not questions_chart:
-                return jsonify({'message': 'No questions data available'}), 404
-            if not attempts_chart:
-                return jsonify({'message': 'No quiz attempts found'}), 404
-            
-            return jsonify({
-                'questions_chart': f'/static/charts/user/{questions_chart}',
-                'attempts_chart': f'/static/charts/user/{attempts_chart}'
-            })
+            specs = user_chart_specs()
+            if isinstance(specs, tuple):
+                return specs
+            return chart_response(specs)
         except Exception as e:
             app.logger.error(f"Error generating user charts: {str(e)}")
-            return jsonify({'message': 'Error generating charts'}), 500
\ No newline at end of file
+            return jsonify({'message': 'Error generating charts'}), 500
+
+    def json_with_etag(payload):
+        """JSON response with a strong ETag over its body; a matching If-None-Match gets a 304"""
+        body = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(hashlib.sha256(body.encode()).hexdigest())
+        # Private because the series can be per user; no-cache so clients always revalidate
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+
+    def chart_series(spec):
+        return {'labels': spec['labels'], 'values': spec['values']} if spec else None
+
+    @cached_by_tags('admin_chart_data', ['subject', 'chapter', 'quiz', 'scores'], local=True)
+    def admin_chart_data():
+        return {
+            'subject_scores': chart_series(charts.admin_subject_scores()),
+            'subject_attempts': chart_series(charts.admin_subject_attempts())
+        }
+
+    @cached_by_tags('user_chart_data', lambda: ['subject', 'questions', user_scores_tag()], per_user=True)
+    def user_chart_data():
+        return {
+            'subject_questions': chart_series(charts.user_subject_questions()),
+            'user_attempts': chart_series(charts.user_subject_attempts(current_user.id))
+        }
+
+    @app.route('/api/charts/admin/data')
+    @auth_required('token', 'session')
+    @roles_required('admin')
+    def get_admin_chart_data():
+        try:
+            return json_with_etag(admin_chart_data())
+        except Exception as e:
+            app.logger.error(f"Error loading admin chart data: {str(e)}")
+            return jsonify({'message': 'Error loading chart data'}), 500
+
+    @app.route('/api/charts/user/data')
+    @auth_required('token', 'session')
+    def get_user_chart_data():
+        try:
+            return json_with_etag(user_chart_data())
+        except Exception as e:
+            app.logger.error(f"Error loading user chart data: {str(e)}")
+            return jsonify({'message': 'Error loading chart data'}), 500
+
+    @app.route('/api/cache/stats')
+    @auth_required('token', 'session')
+    @roles_required('admin')
+    def get_cache_stats():
+        return jsonify(cache_stats())
@@ -1,17 +1,20 @@
-from celery import Celery
+from celery import Celery, group, chord
 from celery.schedules import crontab
-from flask_excel import make_response_from_array, init_excel
-from datetime import datetime, timedelta
+from celery.signals import worker_process_init
+from datetime import datetime
 from flask_mail import Message
 import pytz
 from functools import wraps
 import traceback
 import os
 import sys
-import io
+import threading
+import time
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from database import analytics_session
+
 celery = Celery('quiz_master')
 
 class Config:
@@ -22,6 +25,9 @@ class Config:
     CELERY_ACCEPT_CONTENT = ['json']
     CELERY_RESULT_SERIALIZER = 'json'
     CELERY_TASK_IGNORE_RESULT = False
+    MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', 50))
+    MAIL_RETRY_LIMIT = int(os.environ.get('MAIL_RETRY_LIMIT', 3))
+    MAIL_RETRY_DELAY = int(os.environ.get('MAIL_RETRY_DELAY', 60))
     CELERY_BEAT_SCHEDULE = {
         'evening-reminder': {
             'task': 'workers.send_daily_reminders',
@@ -30,6 +36,18 @@ class Config:
         'monthly-report': {
             'task': 'workers.send_monthly_reports',
             'schedule': crontab(0, 0, day_of_month='1')
+        },
+        'purge-exports': {
+            'task': 'workers.purge_exports',
+            'schedule': crontab(minute=30)
+        },
+        'reconcile-rollups': {
+            'task': 'workers.reconcile_rollups',
+            'schedule': crontab(hour=3, minute=15)
+        },
+        'warm-quiz-snapshots': {
+            'task': 'workers.warm_quiz_snapshots',
+            'schedule': crontab(minute='*/10')
         }
     }
 
@@ -44,26 +62,48 @@ celery.conf.update(
     beat_schedule=Config.CELERY_BEAT_SCHEDULE
 )
 
+# One Flask app per worker process, shared by every task it runs
+_flask_app = None
+_flask_app_lock = threading.Lock()
+
 def get_flask_app():
+    global _flask_app
+    if _flask_app is not None:
+        return _flask_app
+    with _flask_app_lock:
+        if _flask_app is not None:
+            return _flask_app
+        try:
+            print("Creating Flask app...")  
+            start = time.perf_counter()
+            from app import create_app
+            flask_app = create_app()
+            print(f"Flask app created successfully in {(time.perf_counter() - start) * 1000:.1f} ms")  
+            _flask_app = flask_app
+            return flask_app
+        except Exception as e:
+            print(f"Error creating Flask app: {str(e)}")  
+            print(f"Python path: {sys.path}")  
+            raise
+
+@worker_process_init.connect
+def init_worker_app(**kwargs):
+    """Build the app when a pool process starts so the first task does not pay for it"""
     try:
-        print("Creating Flask app...")  
-        from app import create_app
-        flask_app = create_app()
-        print("Flask app created successfully")  
-        init_excel(flask_app)
-        return flask_app
+        get_flask_app()
     except Exception as e:
-        print(f"Error creating Flask app: {str(e)}")  
-        print(f"Python path: {sys.path}")  
-        raise
+        # Raising here kills the pool process; the first task retries through get_flask_app
+        print(f"Deferring Flask app creation to the first task: {str(e)}")
 
 def ensure_context(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
         try:
+            start = time.perf_counter()
             flask_app = get_flask_app()
             with flask_app.app_context():
-                print(f"Executing task with app context: {f.__name__}")  
+                startup_ms = (time.perf_counter() - start) * 1000
+                print(f"Executing task with app context: {f.__name__} (startup {startup_ms:.1f} ms)")  
                 return f(*args, **kwargs)
         except Exception as e:
             print(f"Context error in {f.__name__}: {str(e)}")  
@@ -144,273 +184,263 @@ def format_email_html(content, title):
     </html>
     """
 
-def generate_csv(data):
-    try:
-        response = make_response_from_array(data, "csv")
-        if response and hasattr(response, 'get_data'):
-            return response.get_data()
-        else:
-            output = io.StringIO()
-            for row in data:
-                output.write(','.join(str(cell) for cell in row) + '\n')
-            return output.getvalue().encode('utf-8')
-    except Exception as e:
-        print(f"CSV generation error: {str(e)}")  
-        raise
+def daily_reminder_message(user, summary, unattempted):
+    html_content = [
+        "<div class='stats'>",
+        f"<h2>Hello {user.full_name or user.email}!</h2>",
+        "<h3>Quiz Status</h3>",
+        "<ul>",
+        f"<li>Quizzes Attempted: <span class='highlight'>{summary['attempts']}</span></li>",
+        f"<li>Quizzes Available: <span class='highlight'>{len(unattempted)}</span></li>"
+    ]
 
-@celery.task(ignore_result=False)
-@ensure_context
-@log_task_status("daily_reminders")
-def send_daily_reminders():
-    from models import User, Quiz, Role
-    from extensions import mail
+    if summary['attempts']:
+        avg_score = summary['total_scored']/summary['attempts']
+        html_content.append(f"<li>Average Score: <span class='highlight'>{avg_score:.2f}%</span></li>")
+
+    html_content.append("</ul></div>")
+
+    if unattempted:
+        html_content.extend([
+            "<h3>Available Quizzes</h3>",
+            "<table>",
+            "<tr><th>Quiz</th><th>Chapter</th><th>Subject</th><th>Questions</th></tr>"
+        ])
     
-    users = User.query.join(User.roles).filter(
-        Role.name == 'user'
-    ).all()
+        for quiz in unattempted:
+            html_content.append(
+                f"<tr>"
+                f"<td>{quiz.name}</td>"
+                f"<td>{quiz.chapter_name}</td>"
+                f"<td>{quiz.subject_name}</td>"
+                f"<td>{quiz.question_count}</td>"
+                f"</tr>"
+            )
     
-    sent_count = 0
-    for user in users:
+        html_content.append("</table>")
+        html_content.append("<p>Don't miss out on these learning opportunities!</p>")
+    else:
+        html_content.append("<p>Great job! You've attempted all available quizzes.</p>")
+
+    message = Message(
+        'Quiz Master - Daily Update',
+        sender='quiz-master@example.com',
+        recipients=[user.email]
+    )
+    message.html = format_email_html("\n".join(html_content), "Daily Quiz Update")
+    return message
+
+def build_daily_reminders(session, user_ids):
+    """Yield (user id, email, Message or None) for a batch of learners"""
+    from report_data import load_users, load_quiz_catalog, attempt_summaries
+
+    # The catalog is shared by every user; only the attempted set differs
+    catalog = load_quiz_catalog(session)
+    catalog_ids = {quiz.id for quiz in catalog}
+    summaries = attempt_summaries(session, user_ids)
+    for user in load_users(session, user_ids):
         try:
-            scores = user.scores
-            attempted_quiz_ids = {s.quiz_id for s in scores}
-            
-            quizzes = Quiz.query.all()
-            unattempted = [q for q in quizzes if q.id not in attempted_quiz_ids]
-            
-            html_content = [
-                "<div class='stats'>",
-                f"<h2>Hello {user.full_name or user.email}!</h2>",
-                "<h3>Quiz Status</h3>",
-                "<ul>",
-                f"<li>Quizzes Attempted: <span class='highlight'>{len(scores)}</span></li>",
-                f"<li>Quizzes Available: <span class='highlight'>{len(unattempted)}</span></li>"
-            ]
-            
-            if scores:
-                avg_score = sum(s.total_scored for s in scores)/len(scores)
-                html_content.append(f"<li>Average Score: <span class='highlight'>{avg_score:.2f}%</span></li>")
-            
-            html_content.append("</ul></div>")
-            
-            if unattempted:
-                html_content.extend([
-                    "<h3>Available Quizzes</h3>",
-                    "<table>",
-                    "<tr><th>Quiz</th><th>Chapter</th><th>Subject</th><th>Questions</th></tr>"
-                ])
-                
-                for quiz in unattempted:
-                    html_content.append(
-                        f"<tr>"
-                        f"<td>{quiz.name}</td>"
-                        f"<td>{quiz.chapter.name}</td>"
-                        f"<td>{quiz.chapter.subject.name}</td>"
-                        f"<td>{len(quiz.questions)}</td>"
-                        f"</tr>"
-                    )
-                
-                html_content.append("</table>")
-                html_content.append("<p>Don't miss out on these learning opportunities!</p>")
-            else:
-                html_content.append("<p>Great job! You've attempted all available quizzes.</p>")
-            
-            message = Message(
-                'Quiz Master - Daily Update',
-                sender='quiz-master@example.com',
-                recipients=[user.email]
-            )
-            message.html = format_email_html("\n".join(html_content), "Daily Quiz Update")
-            
-            mail.send(message)
-            sent_count += 1
-            print(f"Reminder sent to {user.email}")  
+            summary = summaries[user.id]
+            unattempted_ids = catalog_ids - summary['quiz_ids']
+            unattempted = [q for q in catalog if q.id in unattempted_ids]
+            message = daily_reminder_message(user, summary, unattempted)
         except Exception as e:
-            print(f"Failed to send reminder to {user.email}: {str(e)}")
+            print(f"Failed to build reminder for {user.email}: {str(e)}")
             print(traceback.format_exc())
-    
-    return f"Daily reminders sent to {sent_count} users"
+            message = None
+        yield user.id, user.email, message
 
-@celery.task(ignore_result=False)
-@ensure_context
-@log_task_status("monthly_reports")
-def send_monthly_reports():
-    from models import User, Quiz, Subject, Role
-    from extensions import mail
+def monthly_report_message(user, report, month_start):
+    html_content = [
+        "<div class='stats'>",
+        f"<h2>Overall Performance for {month_start.strftime('%B %Y')}</h2>",
+        "<ul>"
+    ]
+
+    if report:
+        html_content.extend([
+            f"<li>Total Quizzes: <span class='highlight'>{report['count']}</span></li>",
+            f"<li>Average Score: <span class='highlight'>{report['average']:.2f}%</span></li>",
+            f"<li>Best Score: <span class='highlight'>{report['best']:.2f}%</span></li>"
+        ])
+    else:
+        html_content.append("<li>No quizzes attempted this month</li>")
+
+    html_content.append("</ul></div>")
+
+    for subject in (report['subjects'] if report else []):
+        html_content.extend([
+            "<div class='stats'>",
+            f"<h3>{subject['name']}</h3>",
+            "<ul>",
+            f"<li>Quizzes: <span class='highlight'>{subject['count']}</span></li>",
+            f"<li>Average: <span class='highlight'>{subject['average']:.2f}%</span></li>",
+            f"<li>Best: <span class='highlight'>{subject['best']:.2f}%</span></li>",
+            "</ul>",
+            "<h4>Recent Attempts</h4>",
+            "<table>",
+            "<tr><th>Quiz</th><th>Score</th><th>Date</th><th>Questions</th></tr>"
+        ])
     
-    users = User.query.join(User.roles).filter(
-        Role.name == 'user'
-    ).all()
+        for attempt in subject['recent']:
+            html_content.append(
+                f"<tr>"
+                f"<td>{attempt.quiz_name}</td>"
+                f"<td>{attempt.total_scored:.2f}%</td>"
+                f"<td>{attempt.time_stamp_of_attempt.strftime('%Y-%m-%d')}</td>"
+                f"<td>{attempt.question_count}</td>"
+                f"</tr>"
+            )
     
-    sent_count = 0
-    for user in users:
+        html_content.extend([
+            "</table>",
+            "</div>"
+        ])
+
+    message = Message(
+        'Quiz Master - Monthly Activity Report',
+        sender='quiz-master@example.com',
+        recipients=[user.email]
+    )
+    message.html = format_email_html(
+        "\n".join(html_content),
+        f"Monthly Activity Report for {user.full_name or user.email}"
+    )
+    return message
+
+def build_monthly_reports(session, user_ids):
+    """Yield (user id, email, Message or None) for a batch of learners"""
+    from report_data import load_users, previous_month, iter_monthly_reports
+
+    month_start, month_end = previous_month()
+    reports = iter_monthly_reports(session, user_ids, month_start, month_end)
+    next_id, next_report = next(reports, (None, None))
+    # Users and reports both come back in id order, so merge them as they stream
+    for user in load_users(session, user_ids):
+        report = None
+        if next_id == user.id:
+            report = next_report
+            next_id, next_report = next(reports, (None, None))
         try:
-            scores = user.scores
-            
-            subject_stats = {}
-            for score in scores:
-                subject = score.quiz.chapter.subject
-                if subject.name not in subject_stats:
-                    subject_stats[subject.name] = {
-                        'total_score': 0,
-                        'count': 0,
-                        'best_score': 0,
-                        'scores': []
-                    }
-                
-                stats = subject_stats[subject.name]
-                stats['total_score'] += score.total_scored
-                stats['count'] += 1
-                stats['best_score'] = max(stats['best_score'], score.total_scored)
-                stats['scores'].append(score)
-            
-            html_content = [
-                "<div class='stats'>",
-                "<h2>Overall Performance</h2>",
-                "<ul>"
-            ]
-            
-            if scores:
-                avg_score = sum(s.total_scored for s in scores)/len(scores)
-                html_content.extend([
-                    f"<li>Total Quizzes: <span class='highlight'>{len(scores)}</span></li>",
-                    f"<li>Average Score: <span class='highlight'>{avg_score:.2f}%</span></li>",
-                    f"<li>Best Score: <span class='highlight'>{max(s.total_scored for s in scores):.2f}%</span></li>"
-                ])
-            else:
-                html_content.append("<li>No quizzes attempted yet</li>")
-            
-            html_content.append("</ul></div>")
-            
-            if subject_stats:
-                for subject, stats in subject_stats.items():
-                    avg = stats['total_score'] / stats['count']
-                    html_content.extend([
-                        "<div class='stats'>",
-                        f"<h3>{subject}</h3>",
-                        "<ul>",
-                        f"<li>Quizzes: <span class='highlight'>{stats['count']}</span></li>",
-                        f"<li>Average: <span class='highlight'>{avg:.2f}%</span></li>",
-                        f"<li>Best: <span class='highlight'>{stats['best_score']:.2f}%</span></li>",
-                        "</ul>",
-                        "<h4>Recent Attempts</h4>",
-                        "<table>",
-                        "<tr><th>Quiz</th><th>Score</th><th>Date</th><th>Questions</th></tr>"
-                    ])
-                    
-                    recent = sorted(stats['scores'], key=lambda s: s.time_stamp_of_attempt, reverse=True)[:5]
-                    for score in recent:
-                        html_content.append(
-                            f"<tr>"
-                            f"<td>{score.quiz.name}</td>"
-                            f"<td>{score.total_scored:.2f}%</td>"
-                            f"<td>{score.time_stamp_of_attempt.strftime('%Y-%m-%d')}</td>"
-                            f"<td>{len(score.quiz.questions)}</td>"
-                            f"</tr>"
-                        )
-                    
-                    html_content.extend([
-                        "</table>",
-                        "</div>"
-                    ])
-            
-            message = Message(
-                'Quiz Master - Monthly Activity Report',
-                sender='quiz-master@example.com',
-                recipients=[user.email]
-            )
-            message.html = format_email_html(
-                "\n".join(html_content),
-                f"Monthly Activity Report for {user.full_name or user.email}"
-            )
-            
-            mail.send(message)
-            sent_count += 1
-            print(f"Report sent to {user.email}")  
+            message = monthly_report_message(user, report, month_start)
         except Exception as e:
-            print(f"Failed to send report to {user.email}: {str(e)}")
+            print(f"Failed to build report for {user.email}: {str(e)}")
             print(traceback.format_exc())
-            continue
-    
-    return f"Monthly reports sent to {sent_count} users"
+            message = None
+        yield user.id, user.email, message
+
+MAIL_BUILDERS = {
+    'daily_reminders': build_daily_reminders,
+    'monthly_reports': build_monthly_reports
+}
+
+def deliver_mail(kind, user_ids):
+    """Render and send one batch over a single SMTP connection"""
+    from mail_delivery import send_batch
+
+    with analytics_session() as session:
+        messages = list(MAIL_BUILDERS[kind](session, user_ids))
+    return send_batch(messages)
+
+def dispatch_mail(kind):
+    """Fan a mailing out to the workers in batches, with a summary once every batch is done"""
+    from report_data import iter_user_batches
+
+    with analytics_session() as session:
+        batches = [
+            [user.id for user in batch]
+            for batch in iter_user_batches(session, Config.MAIL_BATCH_SIZE)
+        ]
+    if not batches:
+        return f"No recipients for {kind}"
+
+    header = group(deliver_mail_batch.s(kind, user_ids) for user_ids in batches)
+    chord(header)(summarize_mail_delivery.s(kind, time.time()))
+    recipients = sum(len(user_ids) for user_ids in batches)
+    return f"Queued {kind} for {recipients} users in {len(batches)} batches"
+
+@celery.task(ignore_result=False)
+@ensure_context
+@log_task_status("mail_batch")
+def deliver_mail_batch(kind, user_ids):
+    result = deliver_mail(kind, user_ids)
+    for user_id in result['failed']:
+        retry_mail_recipient.apply_async((kind, user_id), countdown=Config.MAIL_RETRY_DELAY)
+    print(f"{kind} batch: {result['sent']} sent, {len(result['failed'])} queued for retry")
+    return result
+
+@celery.task(bind=True, ignore_result=False, max_retries=Config.MAIL_RETRY_LIMIT)
+@ensure_context
+def retry_mail_recipient(self, kind, user_id):
+    result = deliver_mail(kind, [user_id])
+    if result['failed']:
+        try:
+            raise self.retry(countdown=Config.MAIL_RETRY_DELAY)
+        except self.MaxRetriesExceededError:
+            print(f"Giving up on {kind} for user {user_id} after {self.max_retries} retries")
+            return result
+    return result
+
+@celery.task(ignore_result=False)
+def summarize_mail_delivery(results, kind, started_at):
+    from mail_delivery import summarize
+
+    summary = summarize(kind, results, time.time() - started_at)
+    print(
+        f"{kind}: {summary['sent']} sent, {summary['failed']} failed across "
+        f"{summary['batches']} batches in {summary['seconds']}s ({summary['per_second']} msg/s)"
+    )
+    return summary
+
+@celery.task(ignore_result=False)
+@ensure_context
+@log_task_status("daily_reminders")
+def send_daily_reminders():
+    return dispatch_mail('daily_reminders')
+
+@celery.task(ignore_result=False)
+@ensure_context
+@log_task_status("monthly_reports")
+def send_monthly_reports():
+    return dispatch_mail('monthly_reports')
 
 @celery.task(ignore_result=False)
 @ensure_context
 @log_task_status("user_export")
-def generate_user_export(admin_email):
-    from models import User, Subject, Role
+def generate_user_export(admin_email, job_id=None):
+    from models import User
     from extensions import mail
+    from report_data import count_learners
+    from user_export import iter_export_rows, write_export, MAX_ATTACHMENT_BYTES
+    import export_jobs
     
-    admin_user = User.query.filter_by(email=admin_email).first()
-    if not admin_user or 'admin' not in [role.name for role in admin_user.roles]:
-        raise ValueError('Unauthorized access')
-    
-    users = User.query.join(User.roles).filter(
-        Role.name == 'user'
-    ).all()
-    
-    subjects = Subject.query.all()
-    subject_names = [s.name for s in subjects]
-    
-    headers = [
-        'User ID', 'Name', 'Email',
-        'Total Quizzes', 'Overall Average', 'Best Score',
-        'Recent Quizzes (7 days)', 'Recent Average',
-        'Last Quiz Date'
-    ]
-    for subject in subject_names:
-        headers.extend([
-            f"{subject} Quizzes",
-            f"{subject} Average",
-            f"{subject} Best",
-            f"{subject} Recent"
-        ])
-    
-    data = [headers]
-    now = datetime.now()
-    week_ago = now - timedelta(days=7)
-    
-    for user in users:
-        scores = user.scores
-        recent_scores = [s for s in scores if s.time_stamp_of_attempt >= week_ago]
-        
-        row = [
-            user.id,
-            user.full_name or 'N/A',
-            user.email,
-        ]
-        
-        if scores:
-            row.extend([
-                len(scores),
-                f"{sum(s.total_scored for s in scores)/len(scores):.2f}%",
-                f"{max(s.total_scored for s in scores):.2f}%",
-                len(recent_scores),
-                f"{sum(s.total_scored for s in recent_scores)/len(recent_scores):.2f}%" if recent_scores else "N/A",
-                scores[-1].time_stamp_of_attempt.strftime('%Y-%m-%d %H:%M')
-            ])
-        else:
-            row.extend(['0', '0%', '0%', '0', 'N/A', 'Never'])
-        
-        for subject in subject_names:
-            subject_scores = [s for s in scores if s.quiz.chapter.subject.name == subject]
-            recent_subject = [s for s in subject_scores if s.time_stamp_of_attempt >= week_ago]
-            
-            if subject_scores:
-                row.extend([
-                    len(subject_scores),
-                    f"{sum(s.total_scored for s in subject_scores)/len(subject_scores):.2f}%",
-                    f"{max(s.total_scored for s in subject_scores):.2f}%",
-                    f"{len(recent_subject)} in last 7 days"
-                ])
-            else:
-                row.extend(['0', '0%', '0%', 'No activity'])
+    try:
+        admin_user = User.query.filter_by(email=admin_email).first()
+        if not admin_user or 'admin' not in [role.name for role in admin_user.roles]:
+            raise ValueError('Unauthorized access')
         
-        data.append(row)
+        export_jobs.purge_expired_exports()
+        with analytics_session() as session:
+            rows = iter_export_rows(session)
+            if job_id:
+                rows = export_jobs.track_progress(job_id, rows, count_learners(session))
+            path, row_count = write_export(rows)
+        if job_id:
+            export_jobs.finish_job(job_id, path, row_count)
+    except Exception as e:
+        if job_id:
+            export_jobs.fail_job(job_id, str(e))
+        raise
     
+    attach = os.path.getsize(path) <= MAX_ATTACHMENT_BYTES
     try:
-        csv_data = generate_csv(data)
-        
+        if attach:
+            delivery = "<p>Your requested export is attached.</p>"
+        else:
+            delivery = "<p>The export is too large to attach.</p>"
+        if job_id:
+            hours = export_jobs.EXPORT_TTL // 3600
+            delivery += f"<p>It can be downloaded from the Summary page for the next {hours} hours.</p>"
         message = Message(
             'Quiz Master - User Data Export',
             sender='quiz-master@example.com',
@@ -419,16 +449,15 @@ def generate_user_export(admin_email):
         message.html = format_email_html(
             f"""
             <h2>User Data Export</h2>
-            <p>Your requested export is attached.</p>
+            {delivery}
+            <p>Users exported: {row_count}</p>
             <p>Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
             """,
             "User Data Export"
         )
-        message.attach(
-            "user_export.csv",
-            "text/csv",
-            csv_data
-        )
+        if attach:
+            with open(path, 'rb') as f:
+                message.attach("user_export.csv", "text/csv", f.read())
         
         mail.send(message)
         return "Export completed and sent"
@@ -437,6 +466,41 @@ def generate_user_export(admin_email):
         error_msg = f"Export failed: {str(e)}\nTraceback: {traceback.format_exc()}"
         print(error_msg)
         raise
+    finally:
+        # Tracked exports stay on disk until the purge; untracked ones have no other reader
+        if attach and not job_id:
+            os.remove(path)
+
+@celery.task(ignore_result=False)
+@ensure_context
+@log_task_status("render_charts")
+def render_charts(specs):
+    import charts
+    paths = [charts.render_chart(spec) for spec in specs]
+    return [os.path.basename(path) for path in paths]
+
+@celery.task(ignore_result=False)
+@ensure_context
+@log_task_status("reconcile_rollups")
+def reconcile_rollups():
+    import counters
+    repaired = counters.rebuild_counters() + counters.rebuild_rollups()
+    return f"Counters and rollups reconciled, {repaired} rows repaired"
+
+@celery.task(ignore_result=False)
+@ensure_context
+def purge_exports():
+    import export_jobs
+    removed = export_jobs.purge_expired_exports()
+    return f"Removed {removed} expired exports"
+
+@celery.task(ignore_result=False)
+@ensure_context
+@log_task_status("warm_quiz_snapshots")
+def warm_quiz_snapshots():
+    import quiz_snapshots
+    warmed = quiz_snapshots.warm_upcoming(get_flask_app())
+    return f"Warmed {warmed} quiz snapshots"
 
 if __name__ == '__main__':
     celery.start()
\ No newline at end of file